@@ -0,0 +1,100 @@
+"""Packed bitset representation of habit completion history"""
+
+from collections.abc import Iterable
+
+
+class CompletionBitmap:
+    """
+    Completion history of one habit packed into an int.
+    Bit i is set when epoch day (origin + i) is completed, so rates are a popcount
+    over a masked range and streaks are runs of set bits.
+    """
+
+    __slots__ = ("bits", "origin")
+
+    # Spans (in days) below which from_days sets bits on the int directly
+    SMALL_SPAN = 256
+
+    def __init__(self, origin: int = 0, bits: int = 0):
+        self.origin = origin
+        self.bits = bits
+
+    @classmethod
+    def from_days(cls, days: Iterable[int], origin: int | None = None) -> "CompletionBitmap":
+        """Builds bitmap from completed epoch days"""
+        days = list(days)
+        if not days:
+            return cls(origin if origin is not None else 0)
+
+        if origin is None:
+            origin = min(days)
+        span = max(days) - origin
+        if span < cls.SMALL_SPAN:
+            # Short ranges (a week, a report period) fit in a few int digits,
+            # where or-ing bits in place beats building a buffer
+            bits = 0
+            for day in days:
+                if day >= origin:
+                    bits |= 1 << (day - origin)
+            return cls(origin, bits)
+
+        buffer = bytearray((span >> 3) + 1)
+        for day in days:
+            offset = day - origin
+            if offset >= 0:
+                buffer[offset >> 3] |= 1 << (offset & 7)
+        return cls(origin, int.from_bytes(buffer, "little"))
+
+    def completed_flags(self, days: Iterable[int]) -> list[bool]:
+        """Returns whether each of days is completed"""
+        bits, origin = self.bits, self.origin
+        return [day >= origin and (bits >> (day - origin)) & 1 == 1 for day in days]
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def window(self, start_day: int, end_day: int) -> int:
+        """Returns bits for days start_day..end_day inclusive, bit 0 being start_day"""
+        if end_day < start_day:
+            return 0
+        offset = start_day - self.origin
+        bits = self.bits >> offset if offset >= 0 else self.bits << -offset
+        return bits & ((1 << (end_day - start_day + 1)) - 1)
+
+    def count(self, start_day: int, end_day: int) -> int:
+        """Counts completed days in range"""
+        return self.window(start_day, end_day).bit_count()
+
+    def bucket_counts(self, bounds: Iterable[tuple[int, int]]) -> list[int]:
+        """Counts completed days in each (start_day, end_day) range, e.g. chart buckets"""
+        bits, origin = self.bits, self.origin
+        counts = []
+        for start_day, end_day in bounds:
+            offset = start_day - origin
+            window = bits >> offset if offset >= 0 else bits << -offset
+            counts.append((window & ((1 << (end_day - start_day + 1)) - 1)).bit_count())
+        return counts
+
+    def completion_rate(self, start_day: int, end_day: int) -> int:
+        """Returns percentage of completed days in range"""
+        if end_day < start_day:
+            return 0
+        return round(self.count(start_day, end_day) / (end_day - start_day + 1) * 100)
+
+    def current_streak(self, start_day: int, end_day: int) -> int:
+        """Counts consecutive completed days ending at end_day, not going before start_day"""
+        if end_day < start_day:
+            return 0
+        length = end_day - start_day + 1
+        missed = ~self.window(start_day, end_day) & ((1 << length) - 1)
+        return length - missed.bit_length()
+
+    def longest_streak(self, start_day: int, end_day: int) -> int:
+        """Returns length of the longest run of completed days in range"""
+        bits = self.window(start_day, end_day)
+        longest = 0
+        # Each step shortens every run by one, so the step count is the longest run
+        while bits:
+            bits &= bits >> 1
+            longest += 1
+        return longest
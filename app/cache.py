@@ -0,0 +1,159 @@
+"""Per-user cache of rendered HTML fragments"""
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from app.database import DBSession, get_user_data_version, run_db
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "database")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+HABIT_ROW_CACHE_MAX_ENTRIES = int(os.getenv("HABIT_ROW_CACHE_MAX_ENTRIES", "4096"))
+
+
+class MemoryVersionStore:
+    """User data versions kept in process memory (single worker)"""
+
+    def __init__(self):
+        # Counters restart with the process, so ETags carry a per-process token
+        self.token = secrets.token_hex(4)
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, _db: DBSession, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+
+class DatabaseVersionStore:
+    """
+    User data versions kept in the user_data_versions table, so a write handled
+    by one gunicorn worker invalidates entries cached by every other worker.
+    Writes bump the counter in their own transaction (see app.services), so a
+    new version is never visible before or after the data it stands for.
+    """
+
+    token = "db"
+
+    async def get(self, db: DBSession, user_id: str) -> int:
+        # Through the request's session, so async mode doesn't block the event loop
+        return await run_db(db, get_user_data_version, user_id)
+
+    def bump(self, user_id: str):
+        """Nothing to do: the write already committed the new version"""
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of response bodies keyed by (user_id, endpoint, params, today).
+    Entries are tagged with the user's data version; a write bumps the version,
+    so every entry of that user (and only that user) stops matching.
+    """
+
+    def __init__(self, versions, max_entries: int, ttl: float):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[int, float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(user_id: str, endpoint: str, params: tuple) -> tuple:
+        # Today is part of the key: week and period views shift at midnight
+        return (user_id, endpoint, params, date.today().toordinal())
+
+    def etag(self, user_id: str, endpoint: str, params: tuple, version: int) -> str:
+        """Returns weak ETag identifying endpoint output for user data version"""
+        digest = hashlib.blake2b(
+            repr(self.make_key(user_id, endpoint, params)).encode(), digest_size=8
+        ).hexdigest()
+        return f'W/"{self.versions.token}-{version}-{digest}"'
+
+    def get(self, user_id: str, endpoint: str, params: tuple, version: int) -> bytes | None:
+        """
+        Returns cached body for current user data version or None.
+        Read the version before building a response and pass the same value
+        to set(), so a write that lands meanwhile is not masked by the new entry.
+        """
+        key = self.make_key(user_id, endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, user_id: str, endpoint: str, params: tuple, body: bytes, version: int):
+        """Stores body rendered from data of given user version"""
+        key = self.make_key(user_id, endpoint, params)
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        """Drops every cached response of user after a write"""
+        self.versions.bump(user_id)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class FragmentCache:
+    """
+    LRU of rendered fragments keyed by everything they are rendered from,
+    so an entry can't go stale and writes don't need to invalidate it
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def set(self, key: tuple, html: str) -> str:
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+habit_row_cache = FragmentCache(HABIT_ROW_CACHE_MAX_ENTRIES)
+
+response_cache = ResponseCache(
+    MemoryVersionStore() if RESPONSE_CACHE_BACKEND == "memory" else DatabaseVersionStore(),
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=RESPONSE_CACHE_TTL,
+)
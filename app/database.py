@@ -1,20 +1,157 @@
 import datetime
 import os
+from collections.abc import Callable
 from pathlib import Path
+from typing import Any, TypeVar
 
-from sqlalchemy import Column, DateTime, Integer, String, create_engine
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    bindparam,
+    case,
+    create_engine,
+    delete,
+    event,
+    false,
+    func,
+    insert,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = BASE_DIR / "habits.db"
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
-connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# Applied to every new SQLite connection; set a variable to an empty value to skip the pragma.
+# WAL lets readers run alongside the single writer and busy_timeout makes writers wait for
+# the lock instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-20000"),  # negative value is in KiB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+
+# "archive": deleting a habit only flags it, completions are purged later in batches
+# "cascade": habits are deleted at once and the database removes their completions
+# through ON DELETE CASCADE foreign keys (meant for PostgreSQL; new tables only)
+HABIT_DELETE_MODE = os.getenv("HABIT_DELETE_MODE", "archive")
+CASCADE_DELETES = HABIT_DELETE_MODE == "cascade"
+if CASCADE_DELETES:
+    SQLITE_PRAGMAS["foreign_keys"] = "ON"
+
+
+class InvalidPragmaError(ValueError):
+    """SQLITE_PRAGMAS value that is not a plain word or number, so it can't be inlined"""
+
+    def __init__(self, name: str, value: str):
+        super().__init__(f"Invalid value for SQLite pragma {name}: {value!r}")
+
+
+def apply_sqlite_pragmas(dbapi_connection, _connection_record):
+    """Connection setup hook that applies SQLITE_PRAGMAS"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if not value:
+                continue
+            if not value.lstrip("-").isalnum():
+                raise InvalidPragmaError(name, value)
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def get_engine_options(url: str, async_mode: bool = False) -> dict:
+    """Returns create_engine() keyword arguments for database URL"""
+    options = {"query_cache_size": DB_QUERY_CACHE_SIZE}
+
+    if url.startswith("sqlite"):
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "cached_statements": SQLITE_STATEMENT_CACHE_SIZE,
+        }
+        if ":memory:" in url or url.rstrip("/").endswith(":"):
+            return options
+        # File databases get a bounded pool; connections stay open so pragmas run once each
+        options["poolclass"] = AsyncAdaptedQueuePool if async_mode else QueuePool
+        options.update(
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT
+        )
+        return options
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    return options
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
+if IS_SQLITE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async mode serves requests through aiosqlite/asyncpg so queries don't block the event loop;
+# the sync engine is still used for schema creation and scripts
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"
+
+DBSession = Session | AsyncSession
+T = TypeVar("T")
+
+
+def make_async_database_url(url: str) -> str:
+    """Converts sync database URL to its async driver equivalent"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:") :]
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix) :]
+    return url
+
+
+if DB_ASYNC:
+    async_engine = create_async_engine(
+        make_async_database_url(SQLALCHEMY_DATABASE_URL),
+        **get_engine_options(SQLALCHEMY_DATABASE_URL, async_mode=True),
+    )
+    if IS_SQLITE:
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def habit_foreign_key() -> tuple:
+    """Foreign key to habits for child tables in cascade mode, none otherwise"""
+    return (ForeignKey("habits.id", ondelete="CASCADE"),) if CASCADE_DELETES else ()
+
 
 class HabitModel(Base):
     __tablename__ = "habits"
@@ -24,23 +161,80 @@ class HabitModel(Base):
     name = Column(String, nullable=False)
     color = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Soft delete: archived habits are hidden at once and purged in the background
+    archived = Column(Boolean, nullable=False, default=False, server_default=false())
+    archived_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_habits_user_archived", "user_id", "archived"),)
 
 
 class CompletionModel(Base):
     __tablename__ = "completions"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    habit_id = Column(String, *habit_foreign_key(), nullable=False)
+    # Days since 1970-01-01 (see app.utils.to_epoch_day)
+    day = Column(Integer, nullable=False)
+
+    # Covers every completions lookup (user, user+habit, user+habit+day range)
+    # and rejects duplicate rows from concurrent toggles
+    __table_args__ = (
+        Index("uq_completions_user_habit_day", "user_id", "habit_id", "day", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class HabitStatsModel(Base):
+    """All-time habit statistics maintained on every completion toggle"""
+
+    __tablename__ = "habit_stats"
+
+    habit_id = Column(String, *habit_foreign_key(), primary_key=True)
     user_id = Column(String, nullable=False, index=True)
-    habit_id = Column(String, nullable=False, index=True)
-    date = Column(String, nullable=False, index=True)
+    total_completions = Column(Integer, nullable=False, default=0)
+    best_streak = Column(Integer, nullable=False, default=0)
+    last_completion_day = Column(Integer, nullable=True)
+    # Length of the run of completed days ending at last_completion_day
+    last_streak = Column(Integer, nullable=False, default=0)
+
+
+class DailyRollupModel(Base):
+    """
+    Completions of a user's non-archived habits per day, maintained on every
+    write, so calendar and report totals read one small row per day
+    """
+
+    __tablename__ = "daily_rollup"
+
+    user_id = Column(String, primary_key=True)
+    # Days since 1970-01-01 (see app.utils.to_epoch_day)
+    day = Column(Integer, primary_key=True)
+    completed_count = Column(Integer, nullable=False, default=0)
+
 
-    __table_args__ = ({"sqlite_autoincrement": True},)
+class HabitSequenceModel(Base):
+    """Last habit number allocated per user, for {user_id}_{n} habit ids"""
+
+    __tablename__ = "habit_sequences"
+
+    user_id = Column(String, primary_key=True)
+    last_number = Column(Integer, nullable=False, default=0)
+
+
+class UserDataVersionModel(Base):
+    """Per-user counter bumped on every write, shared by all worker processes"""
+
+    __tablename__ = "user_data_versions"
+
+    user_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 
 Base.metadata.create_all(bind=engine)
 
 
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -48,62 +242,247 @@ def get_db():
         db.close()
 
 
-def is_completed(db: Session, user_id: str, habit_id: str, date_str: str) -> bool:
-    """Checks if habit is completed for user on specified date"""
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if DB_ASYNC else get_sync_db
+
+
+async def dispose_engines():
+    """Closes pooled connections; open aiosqlite connections keep their threads alive"""
+    if DB_ASYNC:
+        await async_engine.dispose()
+    engine.dispose()
+
+
+async def run_db(db: DBSession, fn: Callable[..., T], *args: Any) -> T:
+    """
+    Runs sync query function fn(db, *args) with either session kind.
+    With AsyncSession the function runs via run_sync, so every query helper
+    in this module has an awaitable form without a second implementation.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return fn(db, *args)
+
+
+def is_completed(db: Session, user_id: str, habit_id: str, day: int) -> bool:
+    """Checks if habit is completed for user on specified epoch day"""
     completion = (
         db.query(CompletionModel)
         .filter(
             CompletionModel.user_id == user_id,
             CompletionModel.habit_id == habit_id,
-            CompletionModel.date == date_str,
+            CompletionModel.day == day,
         )
         .first()
     )
     return completion is not None
 
 
+def insert_ignoring_duplicates(db: Session, model):
+    """Returns INSERT statement for model that skips rows violating unique constraints"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_insert(model).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        return postgresql_insert(model).on_conflict_do_nothing()
+    return insert(model).prefix_with("IGNORE")
+
+
+def toggle_completion_record(
+    db: Session, user_id: str, habit_id: str, day: int
+) -> tuple[bool, bool]:
+    """
+    Toggles habit completion for epoch day without a preceding SELECT.
+    Deletes the row if it exists, otherwise inserts it. Returns (completed, changed);
+    changed is False when a concurrent toggle inserted the row first, so the
+    completion must not be counted again.
+    """
+    deleted = db.execute(
+        delete(CompletionModel).where(
+            CompletionModel.user_id == user_id,
+            CompletionModel.habit_id == habit_id,
+            CompletionModel.day == day,
+        )
+    ).rowcount
+    if deleted:
+        return False, True
+
+    inserted = db.execute(
+        insert_ignoring_duplicates(db, CompletionModel).values(
+            user_id=user_id, habit_id=habit_id, day=day
+        )
+    ).rowcount
+    return True, bool(inserted)
+
+
+def set_completion_records(
+    db: Session, user_id: str, states: dict[tuple[str, int], bool]
+) -> list[tuple[str, int, bool]]:
+    """
+    Sets completion state of many (habit_id, day) pairs with one SELECT,
+    one bulk INSERT and one bulk DELETE. Pairs already in the wanted state
+    are left alone; returns (habit_id, day, completed) of pairs that changed.
+    Changes are read back with RETURNING, so rows a concurrent request inserted
+    or deleted in the meantime are not reported.
+    """
+    if not states:
+        return []
+
+    pairs = tuple_(CompletionModel.habit_id, CompletionModel.day)
+    existing = {
+        (habit_id, day)
+        for habit_id, day in db.query(CompletionModel.habit_id, CompletionModel.day).filter(
+            CompletionModel.user_id == user_id, pairs.in_(list(states))
+        )
+    }
+    to_insert = [key for key, completed in states.items() if completed and key not in existing]
+    to_delete = [key for key, completed in states.items() if not completed and key in existing]
+
+    dialect = db.get_bind().dialect
+    inserted, deleted = [], []
+    if to_insert:
+        statement = insert_ignoring_duplicates(db, CompletionModel)
+        rows = [
+            {"user_id": user_id, "habit_id": habit_id, "day": day} for habit_id, day in to_insert
+        ]
+        if dialect.insert_executemany_returning:
+            returning = statement.returning(CompletionModel.habit_id, CompletionModel.day)
+            inserted = [tuple(row) for row in db.execute(returning, rows)]
+        else:
+            inserted = [
+                key
+                for key, row in zip(to_insert, rows, strict=True)
+                if db.execute(statement, row).rowcount
+            ]
+    if to_delete:
+        statement = delete(CompletionModel).where(
+            CompletionModel.user_id == user_id, pairs.in_(to_delete)
+        )
+        if dialect.delete_returning:
+            returning = statement.returning(CompletionModel.habit_id, CompletionModel.day)
+            deleted = [tuple(row) for row in db.execute(returning)]
+        else:
+            deleted = [
+                (habit_id, day)
+                for habit_id, day in to_delete
+                if db.execute(
+                    delete(CompletionModel).where(
+                        CompletionModel.user_id == user_id,
+                        CompletionModel.habit_id == habit_id,
+                        CompletionModel.day == day,
+                    )
+                ).rowcount
+            ]
+
+    return [(habit_id, day, True) for habit_id, day in inserted] + [
+        (habit_id, day, False) for habit_id, day in deleted
+    ]
+
+
+def add_daily_completions(db: Session, user_id: str, deltas: dict[int, int]):
+    """
+    Adds {day: delta} to the user's daily completed counts, never below 0.
+    Call it after writing the completions: a day without a rollup row (e.g.
+    the table was created over existing completions) is counted from them
+    instead, so a delta is never stored as the whole count.
+    """
+    rows = [{"b_day": day, "b_delta": delta} for day, delta in deltas.items() if delta]
+    if not rows:
+        return
+
+    rollup = DailyRollupModel.__table__
+    new_count = rollup.c.completed_count + bindparam("b_delta")
+    db.execute(
+        update(rollup)
+        .where(rollup.c.user_id == user_id, rollup.c.day == bindparam("b_day"))
+        .values(completed_count=case((new_count > 0, new_count), else_=0)),
+        rows,
+    )
+    days = [row["b_day"] for row in rows]
+    stored = select(DailyRollupModel.day).where(
+        DailyRollupModel.user_id == user_id,
+        DailyRollupModel.day == CompletionModel.day,
+    )
+    db.execute(
+        insert(DailyRollupModel).from_select(
+            ["user_id", "day", "completed_count"],
+            select(CompletionModel.user_id, CompletionModel.day, func.count(CompletionModel.id))
+            .join(HabitModel, HabitModel.id == CompletionModel.habit_id)
+            .where(
+                CompletionModel.user_id == user_id,
+                CompletionModel.day.in_(days),
+                HabitModel.archived == false(),
+                ~stored.exists(),
+            )
+            .group_by(CompletionModel.user_id, CompletionModel.day),
+        )
+    )
+
+
+def get_owned_habit_ids(db: Session, user_id: str, habit_ids: list[str]) -> set[str]:
+    """Gets which of habit_ids belong to user with one query"""
+    if not habit_ids:
+        return set()
+    return {
+        habit_id
+        for (habit_id,) in db.query(HabitModel.id).filter(
+            HabitModel.user_id == user_id,
+            HabitModel.id.in_(habit_ids),
+            HabitModel.archived == false(),
+        )
+    }
+
+
+def habit_to_dict(habit: HabitModel) -> dict:
+    return {
+        "id": habit.id,
+        "name": habit.name,
+        "color": habit.color,
+        "created_at": (
+            habit.created_at.isoformat()
+            if habit.created_at
+            else datetime.datetime.now().isoformat()
+        ),
+    }
+
+
 def get_all_habits(db: Session, user_id: str) -> list[dict]:
     """Gets all user habits from database"""
-    habits = db.query(HabitModel).filter(HabitModel.user_id == user_id).all()
-    return [
-        {
-            "id": habit.id,
-            "name": habit.name,
-            "color": habit.color,
-            "created_at": (
-                habit.created_at.isoformat()
-                if habit.created_at
-                else datetime.datetime.now().isoformat()
-            ),
-        }
-        for habit in habits
-    ]
+    habits = (
+        db.query(HabitModel)
+        .filter(HabitModel.user_id == user_id, HabitModel.archived == false())
+        .all()
+    )
+    return [habit_to_dict(habit) for habit in habits]
 
 
 def get_habit_by_id(db: Session, user_id: str, habit_id: str) -> dict:
     """Gets habit by ID for specific user"""
     habit = (
         db.query(HabitModel)
-        .filter(HabitModel.id == habit_id, HabitModel.user_id == user_id)
+        .filter(
+            HabitModel.id == habit_id,
+            HabitModel.user_id == user_id,
+            HabitModel.archived == false(),
+        )
         .first()
     )
     if habit:
-        return {
-            "id": habit.id,
-            "name": habit.name,
-            "color": habit.color,
-            "created_at": (
-                habit.created_at.isoformat()
-                if habit.created_at
-                else datetime.datetime.now().isoformat()
-            ),
-        }
+        return habit_to_dict(habit)
     return None
 
 
 def get_habits_count_by_user(db: Session, user_id: str) -> int:
     """Gets count of user habits"""
-    return db.query(HabitModel).filter(HabitModel.user_id == user_id).count()
+    return (
+        db.query(HabitModel)
+        .filter(HabitModel.user_id == user_id, HabitModel.archived == false())
+        .count()
+    )
 
 
 def get_max_habit_number_by_user(db: Session, user_id: str) -> int:
@@ -123,3 +502,57 @@ def get_max_habit_number_by_user(db: Session, user_id: str) -> int:
                 continue
 
     return max_num
+
+
+def allocate_habit_number(db: Session, user_id: str) -> int:
+    """
+    Allocates next habit number of user with a single UPDATE ... RETURNING.
+    The row stays locked until the caller commits, so concurrent adds get
+    distinct numbers. The counter of a user who has none yet is seeded once
+    from existing habit ids.
+    """
+    increment = (
+        update(HabitSequenceModel)
+        .where(HabitSequenceModel.user_id == user_id)
+        .values(last_number=HabitSequenceModel.last_number + 1)
+    )
+
+    def next_number() -> int | None:
+        if db.get_bind().dialect.update_returning:
+            return db.execute(increment.returning(HabitSequenceModel.last_number)).scalar()
+        if not db.execute(increment).rowcount:
+            return None
+        return db.get(HabitSequenceModel, user_id, populate_existing=True).last_number
+
+    number = next_number()
+    if number is None:
+        db.execute(
+            insert_ignoring_duplicates(db, HabitSequenceModel).values(
+                user_id=user_id, last_number=get_max_habit_number_by_user(db, user_id)
+            )
+        )
+        number = next_number()
+    return number
+
+
+def get_user_data_version(db: Session, user_id: str) -> int:
+    """Gets current data version of user, 0 if user never wrote anything"""
+    version = (
+        db.query(UserDataVersionModel.version)
+        .filter(UserDataVersionModel.user_id == user_id)
+        .scalar()
+    )
+    return version or 0
+
+
+def bump_user_data_version(db: Session, user_id: str):
+    """Increments data version of user, creating the counter on first write"""
+    updated = (
+        db.query(UserDataVersionModel)
+        .filter(UserDataVersionModel.user_id == user_id)
+        .update({UserDataVersionModel.version: UserDataVersionModel.version + 1})
+    )
+    if not updated:
+        db.execute(
+            insert_ignoring_duplicates(db, UserDataVersionModel).values(user_id=user_id, version=1)
+        )
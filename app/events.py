@@ -0,0 +1,176 @@
+"""Per-user server-sent events: in-process pub/sub with optional cross-worker fan-out"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "32"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_BROKER_DIR = os.getenv("EVENTS_BROKER_DIR", "")
+
+# Sent instead of the dropped events when a client falls behind; it refetches everything
+RESYNC_EVENT = "resync"
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One open event stream with a bounded queue of (event, data) pairs;
+    client_id identifies the page, so its own writes are not echoed back
+    """
+
+    def __init__(self, max_size: int, client_id: str | None = None):
+        self.client_id = client_id
+        self.queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(max_size)
+        self.dropped = 0
+
+    def put(self, event: str, data: str):
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # A slow consumer must not hold memory or block publishers:
+            # drop what it hasn't read and ask it to resync instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.dropped += 1
+            self.queue.put_nowait((RESYNC_EVENT, ""))
+
+
+class EventBroker:
+    """
+    Delivers events to every open stream of a user in this worker and, when a
+    broker directory is configured, to the other workers through it
+    """
+
+    def __init__(self, queue_size: int, broker_dir: str = ""):
+        self.queue_size = queue_size
+        self._subscriptions: dict[str, set[Subscription]] = defaultdict(set)
+        self._fanout = DatagramFanout(broker_dir, self.deliver) if broker_dir else None
+
+    def subscribe(self, user_id: str, client_id: str | None = None) -> Subscription:
+        subscription = Subscription(self.queue_size, client_id)
+        self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id: str, subscription: Subscription):
+        subscriptions = self._subscriptions.get(user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[user_id]
+
+    def deliver(self, user_id: str, event: str, data: str, exclude: str | None = None):
+        """Queues event for the user's streams in this worker, except client exclude"""
+        for subscription in self._subscriptions.get(user_id, ()):
+            if exclude is None or subscription.client_id != exclude:
+                subscription.put(event, data)
+
+    def publish(self, user_id: str, event: str, data: str, exclude: str | None = None):
+        self.deliver(user_id, event, data, exclude)
+        if self._fanout is not None:
+            self._fanout.send(user_id, event, data, exclude)
+
+    def connections(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def start(self):
+        if self._fanout is not None:
+            self._fanout.start()
+
+    def stop(self):
+        if self._fanout is not None:
+            self._fanout.stop()
+
+
+class DatagramFanout:
+    """
+    Local stand-in for a message broker: every worker binds a Unix datagram
+    socket in broker_dir and sends each event to the sockets of all others.
+    Sockets of workers that are gone are removed on the first failed send.
+    """
+
+    MAX_DATAGRAM = 64 * 1024
+
+    def __init__(self, broker_dir: str, on_event):
+        self.broker_dir = Path(broker_dir)
+        self.on_event = on_event
+        self.path = self.broker_dir / f"worker-{os.getpid()}.sock"
+        self._socket: socket.socket | None = None
+
+    def start(self):
+        self.broker_dir.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(str(self.path))
+        self._socket.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._receive)
+
+    def stop(self):
+        if self._socket is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        self.path.unlink(missing_ok=True)
+
+    def _receive(self):
+        while self._socket is not None:
+            try:
+                message = self._socket.recv(self.MAX_DATAGRAM)
+            except BlockingIOError:
+                return
+            self.on_event(*json.loads(message))
+
+    def send(self, user_id: str, event: str, data: str, exclude: str | None = None):
+        if self._socket is None:
+            return
+        message = json.dumps([user_id, event, data, exclude]).encode()
+        if len(message) > self.MAX_DATAGRAM:
+            # Too large for one datagram: other workers' clients refetch instead
+            message = json.dumps([user_id, RESYNC_EVENT, "", exclude]).encode()
+        for peer in self.broker_dir.glob("worker-*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                self._socket.sendto(message, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                peer.unlink(missing_ok=True)
+            except BlockingIOError:
+                logger.warning("Event dropped, worker socket %s is full", peer)
+
+
+event_broker = EventBroker(EVENTS_QUEUE_SIZE, EVENTS_BROKER_DIR)
+
+
+def format_event(event: str, data: str) -> str:
+    """Formats one server-sent event; every data line gets its own field"""
+    lines = "".join(f"data: {line}\n" for line in data.splitlines() or [""])
+    return f"event: {event}\n{lines}\n"
+
+
+async def stream_events(
+    user_id: str, client_id: str | None = None, heartbeat: float = EVENTS_HEARTBEAT
+) -> AsyncIterator[str]:
+    """
+    Yields the user's events as text/event-stream until the client disconnects;
+    a comment line every heartbeat seconds keeps proxies from closing the stream
+    """
+    subscription = event_broker.subscribe(user_id, client_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event, data = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            yield format_event(event, data)
+    finally:
+        event_broker.unsubscribe(user_id, subscription)
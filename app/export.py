@@ -0,0 +1,109 @@
+"""Streaming export of a user's habits and completion history"""
+
+import csv
+import io
+import json
+import os
+from collections.abc import Iterator
+
+from sqlalchemy import false, select
+from sqlalchemy.orm import Session
+
+from app.database import CompletionModel, HabitModel, SessionLocal
+from app.utils import from_epoch_day
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+CSV_COLUMNS = ["habit_id", "habit_name", "color", "created_at", "date"]
+
+
+def get_export_habits(db: Session, user_id: str) -> dict[str, dict]:
+    """Gets user habits keyed by id with JSON-serializable fields"""
+    return {
+        habit.id: {
+            "id": habit.id,
+            "name": habit.name,
+            "color": habit.color,
+            "created_at": habit.created_at.isoformat() if habit.created_at else None,
+        }
+        for habit in db.query(HabitModel).filter(
+            HabitModel.user_id == user_id, HabitModel.archived == false()
+        )
+    }
+
+
+def iter_completion_chunks(db: Session, user_id: str) -> Iterator[list[tuple[str, int]]]:
+    """
+    Yields (habit_id, day) rows ordered by habit and day, EXPORT_CHUNK_SIZE at a time.
+    yield_per fetches rows in batches (a server-side cursor on PostgreSQL),
+    so memory does not grow with the length of the history.
+    """
+    result = db.execute(
+        select(CompletionModel.habit_id, CompletionModel.day)
+        .where(CompletionModel.user_id == user_id)
+        .order_by(CompletionModel.habit_id, CompletionModel.day)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    yield from result.partitions()
+
+
+# Exporters open their own session: StreamingResponse keeps iterating
+# after the endpoint returned, in a threadpool, so the event loop is not blocked
+
+
+def export_csv(user_id: str) -> Iterator[str]:
+    """Streams one CSV row per completion; habits without completions get an empty date"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+
+    with SessionLocal() as db:
+        habits = get_export_habits(db, user_id)
+        completed_habits = set()
+        for rows in iter_completion_chunks(db, user_id):
+            for habit_id, day in rows:
+                habit = habits.get(habit_id)
+                if habit is None:
+                    continue
+                completed_habits.add(habit_id)
+                writer.writerow(
+                    (
+                        habit_id,
+                        habit["name"],
+                        habit["color"],
+                        habit["created_at"],
+                        from_epoch_day(day).isoformat(),
+                    )
+                )
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    for habit_id, habit in habits.items():
+        if habit_id not in completed_habits:
+            writer.writerow((habit_id, habit["name"], habit["color"], habit["created_at"], ""))
+    yield buffer.getvalue()
+
+
+def export_ndjson(user_id: str) -> Iterator[str]:
+    """Streams a "habit" line per habit, then a "completion" line per completion"""
+    with SessionLocal() as db:
+        habits = get_export_habits(db, user_id)
+        yield "".join(
+            json.dumps({"type": "habit", **habit}, ensure_ascii=False) + "\n"
+            for habit in habits.values()
+        )
+        for rows in iter_completion_chunks(db, user_id):
+            yield "".join(
+                f'{{"type": "completion", "habit_id": {json.dumps(habit_id)}, '
+                f'"date": "{from_epoch_day(day).isoformat()}"}}\n'
+                for habit_id, day in rows
+                # Archived habits keep their completions until purged
+                if habit_id in habits
+            )
+
+
+EXPORT_FORMATS = {
+    "csv": (export_csv, "text/csv"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+}
@@ -0,0 +1,208 @@
+"""Bulk import of habit history from CSV or NDJSON (e.g. exports of other trackers)"""
+
+import csv
+import json
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import NamedTuple
+
+from sqlalchemy import false, func
+from sqlalchemy.orm import Session
+
+from app.database import (
+    CompletionModel,
+    HabitModel,
+    allocate_habit_number,
+    bump_user_data_version,
+    insert_ignoring_duplicates,
+)
+from app.services import build_habit, rebuild_daily_rollup, rebuild_habit_stats
+from app.utils import parse_epoch_day
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "10000"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 2**20)))
+
+CSV_REQUIRED_COLUMNS = ("habit_name", "date")
+
+
+class InvalidImportFileError(ValueError):
+    """Input that is not a habit history at all, e.g. CSV without the required columns"""
+
+
+class InvalidImportRecordError(ValueError):
+    """Line of an import file that can't be read as a habit or completion"""
+
+    def __init__(self, line_number: int, problem: str):
+        super().__init__(f"line {line_number}: {problem}")
+
+
+class ImportRecord(NamedTuple):
+    """
+    One parsed input record. habit_key groups records of one source habit;
+    date is None for a habit without completions.
+    """
+
+    habit_key: str
+    habit_name: str
+    date: str | None
+
+
+def parse_csv_records(lines: Iterable[str]) -> Iterator[ImportRecord]:
+    """
+    Parses CSV with a header row: habit_name and date columns are required,
+    habit_id (source id) is optional. GET /export output is accepted as is.
+    """
+    reader = csv.DictReader(lines)
+    missing = [column for column in CSV_REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise InvalidImportFileError("header has no " + ", ".join(missing) + " column")
+    for row in reader:
+        name = (row.get("habit_name") or "").strip()
+        if not name:
+            continue
+        yield ImportRecord(row.get("habit_id") or name, name, row.get("date") or None)
+
+
+def get_text_field(item: dict, field: str, line_number: int) -> str | None:
+    """Returns optional string field of an NDJSON record"""
+    value = item.get(field)
+    if value is not None and not isinstance(value, str):
+        raise InvalidImportRecordError(line_number, f"{field} must be a string")
+    return value
+
+
+def parse_ndjson_records(lines: Iterable[str]) -> Iterator[ImportRecord]:
+    """
+    Parses NDJSON as written by GET /export: "habit" lines with id and name,
+    then "completion" lines with habit_id (or habit_name) and date.
+    """
+    names: dict[str, str] = {}
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise InvalidImportRecordError(line_number, "not valid JSON") from None
+        if not isinstance(item, dict):
+            raise InvalidImportRecordError(line_number, "expected a JSON object")
+
+        fields = {
+            field: get_text_field(item, field, line_number)
+            for field in ("type", "id", "name", "habit_id", "habit_name", "date")
+        }
+        if fields["type"] == "habit":
+            if not fields["id"] or not fields["name"]:
+                raise InvalidImportRecordError(line_number, "habit needs an id and a name")
+            names[fields["id"]] = fields["name"]
+            yield ImportRecord(fields["id"], fields["name"], None)
+        else:
+            key = fields["habit_id"] or fields["habit_name"]
+            name = names.get(key) or fields["habit_name"]
+            if key and name:
+                yield ImportRecord(key, name, fields["date"])
+
+
+IMPORT_PARSERS = {"csv": parse_csv_records, "ndjson": parse_ndjson_records}
+
+
+def parse_import_file(body: bytes, import_format: str) -> list[ImportRecord]:
+    """Parses a whole uploaded file, raising ValueError subclasses on bad input"""
+    lines = body.decode("utf-8-sig").splitlines()
+    return list(IMPORT_PARSERS[import_format](lines))
+
+
+def count_user_completions(db: Session, user_id: str) -> int:
+    return (
+        db.query(func.count(CompletionModel.id)).filter(CompletionModel.user_id == user_id).scalar()
+    )
+
+
+def import_history(
+    db: Session,
+    user_id: str,
+    records: Iterable[ImportRecord],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    progress: Callable[[dict], None] | None = None,
+) -> dict:
+    """
+    Imports records for user. Habits are matched by name with existing ones,
+    new habits get ids of the usual {user_id}_{n} scheme. Completions are
+    inserted chunk_size rows per executemany, skipping duplicates of
+    (user, habit, day), and committed per chunk, so an interrupted import
+    can simply be run again. Returns summary with counters and throughput.
+    """
+    started = time.perf_counter()
+    before = count_user_completions(db, user_id)
+    habits = (
+        db.query(HabitModel)
+        .filter(HabitModel.user_id == user_id, HabitModel.archived == false())
+        .all()
+    )
+    habit_ids = {habit.name: habit.id for habit in habits}
+    habits_count = len(habits)
+
+    key_to_habit_id: dict[str, str] = {}
+    touched: set[str] = set()
+    stats = {"rows": 0, "skipped": 0, "habits_created": 0}
+    chunk: set[tuple[str, int]] = set()
+
+    def flush():
+        if chunk:
+            # New habits go first: in cascade mode completions have a foreign key to them
+            db.flush()
+            db.execute(
+                insert_ignoring_duplicates(db, CompletionModel),
+                [{"user_id": user_id, "habit_id": habit_id, "day": day} for habit_id, day in chunk],
+            )
+            chunk.clear()
+        bump_user_data_version(db, user_id)
+        db.commit()
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress({**stats, "elapsed": elapsed, "rows_per_second": stats["rows"] / elapsed})
+
+    for record in records:
+        stats["rows"] += 1
+        habit_id = key_to_habit_id.get(record.habit_key)
+        if habit_id is None:
+            habit_id = habit_ids.get(record.habit_name)
+            if habit_id is None:
+                number = allocate_habit_number(db, user_id)
+                habit = build_habit(user_id, number, habits_count, record.habit_name)
+                db.add(habit)
+                habit_id = habit_ids[record.habit_name] = habit.id
+                habits_count += 1
+                stats["habits_created"] += 1
+            key_to_habit_id[record.habit_key] = habit_id
+
+        if record.date is None:
+            continue
+        try:
+            day = parse_epoch_day(record.date.strip())
+        except ValueError:
+            stats["skipped"] += 1
+            continue
+        chunk.add((habit_id, day))
+        touched.add(habit_id)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    for habit_id in touched:
+        rebuild_habit_stats(db, user_id, habit_id)
+    bump_user_data_version(db, user_id)
+    if touched:
+        # Duplicates were skipped by the database, so recount rather than add;
+        # commits the statistics along with the rollup
+        rebuild_daily_rollup(db, user_id)
+    db.commit()
+
+    elapsed = time.perf_counter() - started
+    return {
+        **stats,
+        "completions_inserted": count_user_completions(db, user_id) - before,
+        "elapsed": round(elapsed, 3),
+        "rows_per_second": round(stats["rows"] / elapsed) if elapsed else 0,
+    }
@@ -0,0 +1,48 @@
+"""Background maintenance jobs run inside the web process"""
+
+import asyncio
+import logging
+import os
+
+from app.database import SessionLocal
+from app.services import purge_archived_habits
+
+HABIT_PURGE_INTERVAL = float(os.getenv("HABIT_PURGE_INTERVAL", "300"))
+HABIT_PURGE_BATCH_SIZE = int(os.getenv("HABIT_PURGE_BATCH_SIZE", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+def purge_archived_habits_once() -> dict:
+    """Purges every archived habit with a fresh session"""
+    with SessionLocal() as db:
+        return purge_archived_habits(db, HABIT_PURGE_BATCH_SIZE)
+
+
+async def run_habit_purge_job():
+    """
+    Purges archived habits every HABIT_PURGE_INTERVAL seconds.
+    Runs in a worker thread so the event loop keeps serving requests;
+    with several workers each runs it, batches are idempotent.
+    """
+    while True:
+        await asyncio.sleep(HABIT_PURGE_INTERVAL)
+        try:
+            purged = await asyncio.to_thread(purge_archived_habits_once)
+        except Exception:
+            logger.exception("Purging archived habits failed, retrying next interval")
+            continue
+        if purged["habits"]:
+            logger.info(
+                "Purged %d archived habits with %d completions",
+                purged["habits"],
+                purged["completions"],
+            )
+
+
+def start_background_jobs() -> list[asyncio.Task]:
+    """Starts enabled jobs; HABIT_PURGE_INTERVAL=0 disables the purge"""
+    tasks = []
+    if HABIT_PURGE_INTERVAL > 0:
+        tasks.append(asyncio.create_task(run_habit_purge_job()))
+    return tasks
@@ -1,36 +1,63 @@
+import os
+import secrets
 from datetime import date
 from pathlib import Path
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, Form, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, Form, Header, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-
-from app.database import (
-    CompletionModel,
-    HabitModel,
-    get_all_habits,
-    get_db,
-    get_habit_by_id,
-    get_habits_count_by_user,
-    get_max_habit_number_by_user,
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.cache import habit_row_cache, response_cache
+from app.database import DBSession, dispose_engines, get_db, run_db
+from app.events import RESYNC_EVENT, event_broker, stream_events
+from app.export import EXPORT_FORMATS
+from app.importer import IMPORT_MAX_BYTES, InvalidImportFileError, import_history, parse_import_file
+from app.jobs import start_background_jobs
+from app.metrics import (
+    METRICS_ENABLED,
+    METRICS_TOKEN,
+    MetricsMiddleware,
+    TimedTemplate,
+    install_query_listeners,
+    metrics_registry,
+    render_timer,
 )
+from app.schemas import CompletionBatch, CompletionBatchResult, CompletionState
 from app.services import (
-    calculate_completion_rate,
-    calculate_streaks,
-    enrich_habits_with_completions,
-    get_completions_batch,
+    create_habit,
+    load_calendar,
+    load_heatmap,
+    load_report,
+    load_toggle_updates,
+    load_week_habits,
+    remove_habit,
+    set_habit_completions,
+    toggle_habit_completion,
 )
-from app.telegram_auth import get_user_id_dependency
-from app.templates_helpers import generate_completion_button
+from app.telegram_auth import (
+    SessionCookieMiddleware,
+    get_events_user_id_dependency,
+    get_form_user_id_dependency,
+    get_optional_user_id_dependency,
+    get_user_id_dependency,
+    sign_events_token,
+)
+from app.tracing import completions_tracer
 from app.utils import (
-    format_date_for_display,
+    REPORT_MAX_DAYS,
+    from_epoch_day,
     get_calendar_data,
-    get_habit_color,
     get_period_dates,
+    get_range_dates,
     get_week_day_names,
     get_week_days,
+    parse_epoch_day,
+    to_epoch_day,
 )
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,33 +66,133 @@ ENV_FILE = BASE_DIR / ".env"
 load_dotenv(dotenv_path=ENV_FILE if ENV_FILE.exists() else None)
 
 TEMPLATES_DIR = BASE_DIR / "templates"
+# Production serves templates as deployed: no mtime check on every render,
+# compiled bytecode shared by workers and restarts
+TEMPLATES_AUTO_RELOAD = os.getenv("DEBUG", "false").lower() == "true"
+TEMPLATES_BYTECODE_CACHE = os.getenv("TEMPLATES_BYTECODE_CACHE", "true").lower() == "true"
 
 app = FastAPI(
     title="Habit Tracker", description="Habit tracker with calendar and reports", version="1.0.0"
 )
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+app.add_middleware(SessionCookieMiddleware)
+templates = Jinja2Templates(
+    directory=str(TEMPLATES_DIR),
+    auto_reload=TEMPLATES_AUTO_RELOAD,
+    bytecode_cache=FileSystemBytecodeCache() if TEMPLATES_BYTECODE_CACHE else None,
+)
+
+if METRICS_ENABLED:
+    install_query_listeners()
+    app.add_middleware(MetricsMiddleware)
+    templates.env.template_class = TimedTemplate
+
+
+async def get_cached_fragment(
+    request: Request, db: DBSession, user_id: str, endpoint: str, params: tuple
+) -> tuple[Response | None, int, str]:
+    """
+    Conditional GET and cache lookup for fragment endpoints, done before any
+    data query or render: the only lookup is the user's data version (one
+    primary-key read with the database backend, none with the memory one).
+    Returns (response to send or None, user data version, ETag).
+    """
+    version = await response_cache.versions.get(db, user_id)
+    etag = response_cache.etag(user_id, endpoint, params, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers), version, etag
+
+    cached_body = response_cache.get(user_id, endpoint, params, version)
+    if cached_body is not None:
+        return HTMLResponse(cached_body, headers=headers), version, etag
+    return None, version, etag
+
+
+def render_habit_rows(
+    habits: list[dict], week_days: list[str], week_names: list[str], user_id: str
+) -> list[Markup]:
+    """
+    Renders habit cards of the week view with the habit_row macro. A card depends
+    only on the habit, the week and which of its days are completed, so rows
+    are cached under that key and unchanged ones are not rendered again.
+    """
+    habit_row = templates.get_template("_fragments.html").module.habit_row
+    rows = []
+    for habit in habits:
+        completed_mask = sum(
+            1 << i for i, day in enumerate(week_days) if habit["completions"].get(day)
+        )
+        key = (habit["id"], habit["name"], habit["color"], user_id, week_days[0], completed_mask)
+        html = habit_row_cache.get(key)
+        if html is None:
+            html = habit_row_cache.set(key, str(habit_row(habit, week_days, week_names, user_id)))
+        rows.append(Markup(html))
+    return rows
+
+
+def render_habits_list(habit_rows: list[Markup], user_id: str) -> str:
+    return templates.get_template("habits_list.html").render(habit_rows=habit_rows, user_id=user_id)
 
 
-@app.middleware("http")
-async def log_completions_requests(request: Request, call_next):
-    if request.url.path == "/completions" and request.method == "POST":
-        import logging
+def publish_update(request: Request, user_id: str, html: str):
+    """
+    Sends out-of-band HTML to the user's other open pages over /events;
+    the page that made the change (X-Client-Id) already has it in its response
+    """
+    event_broker.publish(user_id, "delta", html, exclude=request.headers.get("x-client-id"))
 
-        logger = logging.getLogger(__name__)
-        content_type = request.headers.get("content-type", "")
-        content_length = request.headers.get("content-length", "")
-        logger.info(f"[DEBUG /completions] Request Content-Type: {content_type}")
-        logger.info(f"[DEBUG /completions] Request Content-Length: {content_length}")
-        logger.info(f"[DEBUG /completions] Request URL: {request.url}")
-        logger.info(f"[DEBUG /completions] Request method: {request.method}")
 
-    response = await call_next(request)
+def store_fragment(
+    response: Response, user_id: str, endpoint: str, params: tuple, *, version: int, etag: str
+) -> Response:
+    """Caches rendered fragment and adds revalidation headers"""
+    response_cache.set(user_id, endpoint, params, response.body, version)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
     return response
 
 
+def get_report_dates(period: str, start: date | None, end: date | None) -> list[date]:
+    """Dates of a report period; "custom" spans start..end, at most REPORT_MAX_DAYS days"""
+    if period != "custom":
+        return get_period_dates(period)
+    if start is None or end is None or start > end:
+        raise HTTPException(status_code=422, detail="Custom period needs start <= end")
+    if (end - start).days >= REPORT_MAX_DAYS:
+        raise HTTPException(
+            status_code=422, detail=f"Custom period is limited to {REPORT_MAX_DAYS} days"
+        )
+    return get_range_dates(start, end)
+
+
+@app.on_event("startup")
+async def load_templates():
+    # Compile (or load bytecode of) every template before the first request
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.get_template(name)
+
+
+@app.on_event("startup")
+async def start_jobs():
+    app.state.background_jobs = start_background_jobs()
+    event_broker.start()
+
+
+@app.on_event("shutdown")
+async def close_database_connections():
+    for task in app.state.background_jobs:
+        task.cancel()
+    event_broker.stop()
+    await dispose_engines()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(
-    request: Request, user_id: str | None = Query(None), db: Session = Depends(get_db)
+    request: Request,
+    user_id: str | None = Depends(get_optional_user_id_dependency),
+    db: DBSession = Depends(get_db),
 ):
     """Main page with weekly calendar"""
     if not user_id:
@@ -141,8 +268,11 @@ async def read_root(
                 setTimeout(() => {
                     const userId = getUserId();
                     if (userId) {
-                        // Redirect to main page with user_id
-                        window.location.href = '/?user_id=' + userId;
+                        // Redirect to main page with user_id and signed initData,
+                        // the server checks it and answers with a session cookie
+                        const initData = window.Telegram.WebApp.initData;
+                        window.location.href = '/?user_id=' + userId
+                            + '&tgWebAppData=' + encodeURIComponent(initData);
                     } else {
                         // Show error message
                         document.getElementById('status').textContent = 'Unable to authenticate';
@@ -159,43 +289,50 @@ async def read_root(
 
     week_days = get_week_days()
     week_names = get_week_day_names()
-    habits = get_all_habits(db, user_id)
-
-    habits_with_completions = enrich_habits_with_completions(db, user_id, habits, week_days)
+    habits_with_completions = await run_db(db, load_week_habits, user_id, week_days)
 
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
-            "habits": habits_with_completions,
-            "week_days": week_days,
-            "week_names": week_names,
+            "habit_rows": render_habit_rows(
+                habits_with_completions, week_days, week_names, user_id
+            ),
             "user_id": user_id,
+            "client_id": secrets.token_urlsafe(8),
+            "events_token": sign_events_token(user_id),
         },
     )
 
 
 @app.get("/habits-list", response_class=HTMLResponse)
 async def get_habits_list(
-    request: Request, user_id: str = Depends(get_user_id_dependency), db: Session = Depends(get_db)
+    request: Request,
+    user_id: str = Depends(get_user_id_dependency),
+    db: DBSession = Depends(get_db),
 ):
     """Endpoint to get updated habits list (for synchronization)"""
+    cached_response, version, etag = await get_cached_fragment(
+        request, db, user_id, "habits-list", ()
+    )
+    if cached_response is not None:
+        return cached_response
+
     week_days = get_week_days()
     week_names = get_week_day_names()
-    habits = get_all_habits(db, user_id)
-
-    habits_with_completions = enrich_habits_with_completions(db, user_id, habits, week_days)
+    habits_with_completions = await run_db(db, load_week_habits, user_id, week_days)
 
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         "habits_list.html",
         {
             "request": request,
-            "habits": habits_with_completions,
-            "week_days": week_days,
-            "week_names": week_names,
+            "habit_rows": render_habit_rows(
+                habits_with_completions, week_days, week_names, user_id
+            ),
             "user_id": user_id,
         },
     )
+    return store_fragment(response, user_id, "habits-list", (), version=version, etag=etag)
 
 
 @app.get("/calendar", response_class=HTMLResponse)
@@ -204,164 +341,212 @@ async def get_calendar(
     user_id: str = Depends(get_user_id_dependency),
     year: int | None = None,
     month: int | None = None,
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
 ):
     """Page with monthly calendar"""
     today = date.today()
     year = year or today.year
     month = month or today.month
 
+    cached_response, version, etag = await get_cached_fragment(
+        request, db, user_id, "calendar", (year, month)
+    )
+    if cached_response is not None:
+        return cached_response
+
     cal, month_name = get_calendar_data(year, month)
     today_str = today.strftime("%Y-%m-%d")
 
-    month_dates = []
-    for week in cal:
-        for day in week:
-            if day != 0:
-                month_dates.append(f"{year}-{month:02d}-{day:02d}")
-
-    habits = get_all_habits(db, user_id)
-
-    if habits:
-        date_strs = month_dates
-        habit_ids = [h["id"] for h in habits]
-        completions_map = get_completions_batch(db, user_id, habit_ids, date_strs)
-
-        day_completions = {}
-        for date_str in month_dates:
-            completed_count = sum(
-                1 for habit_id in habit_ids if completions_map.get((habit_id, date_str), False)
-            )
-            percentage = round((completed_count / len(habits)) * 100) if habits else 0
-            day_completions[date_str] = {
-                "completed": completed_count,
-                "total": len(habits),
-                "percentage": percentage,
-            }
-    else:
-        day_completions = {
-            date_str: {"completed": 0, "total": 0, "percentage": 0} for date_str in month_dates
-        }
+    first_day = to_epoch_day(date(year, month, 1))
+    month_days = [first_day + i for i in range(sum(1 for week in cal for day in week if day))]
 
-    return templates.TemplateResponse(
+    calendar_data = await run_db(db, load_calendar, user_id, month_days)
+
+    response = templates.TemplateResponse(
         "calendar.html",
         {
             "request": request,
-            "habits": habits,
+            "habits": calendar_data["habits"],
             "calendar": cal,
             "month_name": month_name,
             "year": year,
             "month": month,
             "today": today_str,
             "user_id": user_id,
-            "day_completions": day_completions,
+            "day_completions": calendar_data["day_completions"],
         },
     )
+    return store_fragment(response, user_id, "calendar", (year, month), version=version, etag=etag)
 
 
 @app.get("/reports", response_class=HTMLResponse)
 async def get_reports(
+    *,
     request: Request,
     user_id: str = Depends(get_user_id_dependency),
     period: str = "7days",
-    db: Session = Depends(get_db),
+    start: date | None = None,
+    end: date | None = None,
+    db: DBSession = Depends(get_db),
 ):
-    """Page with reports and statistics"""
-    dates = get_period_dates(period)
-    habits = get_all_habits(db, user_id)
-
-    if not habits:
-        return templates.TemplateResponse(
-            "reports.html",
-            {
-                "request": request,
-                "habits": [],
-                "chart_data": [],
-                "period": period,
-            },
-        )
-
-    date_strs = [d.strftime("%Y-%m-%d") for d in dates]
-    habit_ids = [h["id"] for h in habits]
-    completions_map = get_completions_batch(db, user_id, habit_ids, date_strs)
-
-    chart_data = []
-    for d in dates:
-        date_str = d.strftime("%Y-%m-%d")
-
-        total_completed = sum(
-            1 for habit in habits if completions_map.get((habit["id"], date_str), False)
-        )
-        data_point = {"date": format_date_for_display(d), "total_completed": total_completed}
+    """Page with reports and statistics; period "custom" reports on start..end"""
+    dates = get_report_dates(period, start, end)
+    params = (period, dates[0], dates[-1]) if period == "custom" else (period,)
+    cached_response, version, etag = await get_cached_fragment(
+        request, db, user_id, "reports", params
+    )
+    if cached_response is not None:
+        return cached_response
 
-        for habit in habits:
-            data_point[habit["name"]] = (
-                1 if completions_map.get((habit["id"], date_str), False) else 0
-            )
-        chart_data.append(data_point)
+    report = await run_db(db, load_report, user_id, dates)
 
-    habits_with_stats = []
-    for habit in habits:
-        streaks = calculate_streaks(db, user_id, habit["id"], dates)
-        completion_rate = calculate_completion_rate(db, user_id, habit["id"], dates)
-
-        habits_with_stats.append(
-            {
-                **habit,
-                "completion_rate": completion_rate,
-                "current_streak": streaks["current_streak"],
-                "max_streak": streaks["max_streak"],
-            }
-        )
-
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         "reports.html",
         {
             "request": request,
-            "habits": habits_with_stats,
-            "chart_data": chart_data,
+            "habits": report["habits"],
+            "chart": report["chart"],
             "period": period,
+            "start": dates[0].isoformat(),
+            "end": dates[-1].isoformat(),
             "user_id": user_id,
         },
     )
+    return store_fragment(response, user_id, "reports", params, version=version, etag=etag)
 
 
-@app.post("/habits")
-async def add_habit(
-    request: Request, name: str = Form(...), user_id: str = Form(...), db: Session = Depends(get_db)
+@app.get("/heatmap", response_class=HTMLResponse)
+async def get_heatmap(
+    request: Request,
+    user_id: str = Depends(get_user_id_dependency),
+    year: int | None = Query(None, ge=1970, le=2999),
+    db: DBSession = Depends(get_db),
 ):
-    """Add new habit"""
-    import datetime
-
-    max_habit_num = get_max_habit_number_by_user(db, user_id)
-    habit_id = f"{user_id}_{max_habit_num + 1}"
-    habits_count = get_habits_count_by_user(db, user_id)
-    color = get_habit_color(habits_count)
+    """Year heatmap of completed habits per day"""
+    today = date.today()
+    year = year or today.year
 
-    new_habit = HabitModel(
-        id=habit_id, user_id=user_id, name=name, color=color, created_at=datetime.datetime.now()
+    cached_response, version, etag = await get_cached_fragment(
+        request, db, user_id, "heatmap", (year,)
     )
-    db.add(new_habit)
-    db.commit()
-    db.refresh(new_habit)
+    if cached_response is not None:
+        return cached_response
 
-    week_days = get_week_days()
-    week_names = get_week_day_names()
-    habits = get_all_habits(db, user_id)
-    habits_with_completions = enrich_habits_with_completions(db, user_id, habits, week_days)
+    heatmap = await run_db(db, load_heatmap, user_id, year)
 
     response = templates.TemplateResponse(
-        "habits_list.html",
+        "heatmap.html",
         {
             "request": request,
-            "habits": habits_with_completions,
-            "week_days": week_days,
-            "week_names": week_names,
+            "weeks": heatmap["weeks"],
+            "months": heatmap["months"],
+            "year": year,
+            "today": today.isoformat(),
             "user_id": user_id,
         },
     )
-    response.headers["HX-Trigger"] = "habitChanged"
-    return response
+    return store_fragment(response, user_id, "heatmap", (year,), version=version, etag=etag)
+
+
+@app.get("/export")
+async def export_history(
+    user_id: str = Depends(get_user_id_dependency),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+):
+    """Download all habits and completions as CSV or NDJSON, streamed in chunks"""
+    exporter, media_type = EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        exporter(user_id),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="habits.{export_format}"',
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@app.get("/events")
+async def get_events(
+    user_id: str = Depends(get_events_user_id_dependency),
+    client_id: str | None = Query(None, max_length=64),
+):
+    """
+    Server-sent events with changes made on the user's other pages:
+    "delta" carries out-of-band HTML to swap in, "resync" asks to reload the views
+    """
+    return StreamingResponse(
+        stream_events(user_id, client_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/import")
+async def import_habit_history(
+    request: Request,
+    user_id: str = Depends(get_user_id_dependency),
+    import_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    db: DBSession = Depends(get_db),
+):
+    """
+    Import habits and completions from a CSV or NDJSON request body.
+    Larger files can be imported with scripts/import_history.py.
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > IMPORT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Import file is too large")
+
+    try:
+        records = await run_in_threadpool(parse_import_file, bytes(body), import_format)
+    except InvalidImportFileError as e:
+        raise HTTPException(status_code=400, detail=f"Not a {import_format} history: {e}") from None
+    except ValueError as e:
+        # UnicodeDecodeError and InvalidImportRecordError included
+        raise HTTPException(status_code=422, detail=f"Invalid {import_format} file: {e}") from None
+
+    if isinstance(db, AsyncSession):
+        summary = await run_db(db, import_history, user_id, records)
+    else:
+        # A file of up to IMPORT_MAX_BYTES would hold the event loop, SSE streams included
+        summary = await run_in_threadpool(import_history, db, user_id, records)
+    response_cache.invalidate(user_id)
+    event_broker.publish(user_id, RESYNC_EVENT, "")
+    return summary
+
+
+@app.post("/habits")
+async def add_habit(
+    request: Request,
+    name: str = Form(...),
+    user_id: str = Depends(get_form_user_id_dependency),
+    db: DBSession = Depends(get_db),
+):
+    """Add new habit"""
+    week_days = get_week_days()
+    week_names = get_week_day_names()
+    habits_with_completions = await run_db(db, create_habit, user_id, name, week_days)
+    response_cache.invalidate(user_id)
+
+    habit_rows = render_habit_rows(habits_with_completions, week_days, week_names, user_id)
+    habits_list_html = render_habits_list(habit_rows, user_id)
+    if len(habit_rows) == 1:
+        # Other pages still show the empty state
+        publish_update(
+            request,
+            user_id,
+            f'<div id="habits-list" hx-swap-oob="innerHTML">{habits_list_html}</div>',
+        )
+    else:
+        fragments = templates.get_template("_fragments.html").module
+        publish_update(
+            request,
+            user_id,
+            str(fragments.habits_count(len(habit_rows), oob=True))
+            + f'<div id="habit-cards" hx-swap-oob="beforeend">{habit_rows[-1]}</div>',
+        )
+    return HTMLResponse(habits_list_html)
 
 
 @app.delete("/habits/{habit_id}")
@@ -369,138 +554,135 @@ async def delete_habit(
     request: Request,
     habit_id: str,
     user_id: str = Depends(get_user_id_dependency),
-    db: Session = Depends(get_db),
+    db: DBSession = Depends(get_db),
 ):
     """Delete habit"""
-    habit = (
-        db.query(HabitModel)
-        .filter(HabitModel.id == habit_id, HabitModel.user_id == user_id)
-        .first()
-    )
-
-    if habit:
-        db.query(CompletionModel).filter(
-            CompletionModel.habit_id == habit_id, CompletionModel.user_id == user_id
-        ).delete()
-        db.delete(habit)
-        db.commit()
+    removed = await run_db(db, remove_habit, user_id, habit_id)
+    if removed:
+        response_cache.invalidate(user_id)
 
     week_days = get_week_days()
     week_names = get_week_day_names()
-    habits = get_all_habits(db, user_id)
-    habits_with_completions = enrich_habits_with_completions(db, user_id, habits, week_days)
+    habits_with_completions = await run_db(db, load_week_habits, user_id, week_days)
+
+    habit_rows = render_habit_rows(habits_with_completions, week_days, week_names, user_id)
+    habits_list_html = render_habits_list(habit_rows, user_id)
+    if removed and not habit_rows:
+        publish_update(
+            request,
+            user_id,
+            f'<div id="habits-list" hx-swap-oob="innerHTML">{habits_list_html}</div>',
+        )
+    elif removed:
+        fragments = templates.get_template("_fragments.html").module
+        publish_update(
+            request,
+            user_id,
+            str(fragments.habits_count(len(habit_rows), oob=True))
+            + f'<div id="habit-{escape(habit_id)}" hx-swap-oob="delete"></div>',
+        )
+    return HTMLResponse(habits_list_html)
 
-    response = templates.TemplateResponse(
-        "habits_list.html",
-        {
-            "request": request,
-            "habits": habits_with_completions,
-            "week_days": week_days,
-            "week_names": week_names,
-            "user_id": user_id,
-        },
+
+@app.post("/completions/batch", response_model=CompletionBatchResult)
+async def set_completions_batch(
+    batch: CompletionBatch,
+    user_id: str = Depends(get_user_id_dependency),
+    db: DBSession = Depends(get_db),
+):
+    """
+    Set completion states in bulk (offline sync, bulk check-ins).
+    Operations are idempotent: each one sets a state instead of toggling it.
+    """
+    operations = [(op.habit_id, to_epoch_day(op.date), op.completed) for op in batch.operations]
+    result = await run_db(db, set_habit_completions, user_id, operations)
+    if result["changed"]:
+        response_cache.invalidate(user_id)
+        event_broker.publish(user_id, RESYNC_EVENT, "")
+
+    return CompletionBatchResult(
+        states=[
+            CompletionState(habit_id=habit_id, date=from_epoch_day(day), completed=completed)
+            for (habit_id, day), completed in result["states"].items()
+        ],
+        not_found=result["not_found"],
+        changed=result["changed"],
     )
-    response.headers["HX-Trigger"] = "habitChanged"
-    return response
 
 
 @app.post("/completions")
-async def toggle_completion(request: Request, db: Session = Depends(get_db)):
-    """Toggle habit completion status"""
-    import logging
-
-    logger = logging.getLogger(__name__)
+async def toggle_completion(
+    *,
+    request: Request,
+    habit_id: str = Form(...),
+    date_str: str = Form(..., alias="date"),
+    user_id: str = Depends(get_form_user_id_dependency),
+    context: str = Form("week"),
+    period: str | None = Form(None),
+    start: date | None = Form(None),
+    end: date | None = Form(None),
+    db: DBSession = Depends(get_db),
+):
+    """
+    Toggle habit completion status.
+    Besides the button, the response carries out-of-band updates of the calendar
+    day ring, the heatmap cell, the habit's rate bar (when a report period is
+    open) and its streaks.
+    """
+    if completions_tracer.sampled():
+        completions_tracer.trace(
+            "POST /completions habit_id=%s date=%s context=%s user_id=%s",
+            habit_id,
+            date_str,
+            context,
+            user_id,
+        )
 
     try:
-        content_type = request.headers.get("content-type", "")
-        content_length = request.headers.get("content-length", "")
-        logger.info(f"[DEBUG /completions] Content-Type: {content_type}")
-        logger.info(f"[DEBUG /completions] Content-Length: {content_length}")
-        logger.info(f"[DEBUG /completions] Request method: {request.method}")
-        logger.info(f"[DEBUG /completions] Request URL: {request.url}")
-        logger.info(f"[DEBUG /completions] All headers: {dict(request.headers)}")
-
-        habit_id = None
-        date = None
-        context = "week"
-        user_id = None
-
-        try:
-            body_bytes = await request.body()
-            body_str = body_bytes.decode("utf-8") if body_bytes else ""
-            logger.info(f"[DEBUG /completions] Request body (raw): '{body_str}'")
-            logger.info(f"[DEBUG /completions] Request body length: {len(body_str)}")
-
-            if body_str:
-                import urllib.parse
-
-                parsed_data = urllib.parse.parse_qs(body_str)
-                logger.info(f"[DEBUG /completions] Parsed body: {parsed_data}")
-
-                habit_id = parsed_data.get("habit_id", [None])[0]
-                date = parsed_data.get("date", [None])[0]
-                context = parsed_data.get("context", ["week"])[0]
-                user_id = parsed_data.get("user_id", [None])[0]
-
-                logger.info(
-                    f"[DEBUG /completions] Parsed values: habit_id={habit_id}, date={date}, context={context}, user_id={user_id}"
-                )
-            else:
-                logger.error("[DEBUG /completions] Body is empty!")
-        except Exception as e:
-            logger.exception(f"[DEBUG /completions] Error reading/parsing body: {e}")
-            import traceback
-
-            logger.exception(f"[DEBUG /completions] Traceback: {traceback.format_exc()}")
-
-        if not habit_id or not date or not user_id:
-            logger.error(
-                f"[DEBUG /completions] Missing required fields: habit_id={habit_id}, date={date}, user_id={user_id}"
-            )
-            raise HTTPException(
-                status_code=422,
-                detail=f"Missing required fields: habit_id={habit_id}, date={date}, user_id={user_id}",
-            )
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception(f"[DEBUG /completions] Error parsing form: {e}")
-        raise HTTPException(status_code=422, detail=f"Error parsing form data: {e!s}")
-
-    if context is None:
-        context = "week"
-
-    habit = get_habit_by_id(db, user_id, habit_id)
+        day = parse_epoch_day(date_str)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid date: {date_str}") from None
+    # Element ids and labels need YYYY-MM-DD, fromisoformat also accepts e.g. 20240101
+    iso_date = from_epoch_day(day).isoformat()
+    period_dates = get_report_dates(period, start, end) if period else None
+
+    habit, completed = await run_db(db, toggle_habit_completion, user_id, habit_id, day)
     if habit is None:
         return HTMLResponse(
             f"<div class='text-red-500'>Habit with id {habit_id} not found</div>", status_code=404
         )
+    response_cache.invalidate(user_id)
 
-    existing = (
-        db.query(CompletionModel)
-        .filter(
-            CompletionModel.user_id == user_id,
-            CompletionModel.habit_id == habit_id,
-            CompletionModel.date == date,
-        )
-        .first()
-    )
-
-    if existing:
-        db.delete(existing)
-        completed = False
-    else:
-        new_completion = CompletionModel(user_id=user_id, habit_id=habit_id, date=date)
-        db.add(new_completion)
-        completed = True
-
-    db.commit()
+    updates = await run_db(db, load_toggle_updates, user_id, habit, day, period_dates)
 
-    day_num = int(date.split("-")[2])
-    button_html = generate_completion_button(
-        habit_id, date, context, completed, habit, day_num, user_id
-    )
-
-    response = HTMLResponse(button_html)
-    response.headers["HX-Trigger"] = "habitChanged"
-    return response
+    is_today = iso_date == date.today().isoformat()
+    with render_timer():
+        fragments = templates.get_template("_fragments.html").module
+        button_html = fragments.completion_button(
+            habit, iso_date, completed, user_id, context=context, is_today=is_today
+        )
+        oob_html = [
+            fragments.calendar_day(iso_date, updates["day"], is_today, oob=True),
+            fragments.heatmap_day(iso_date, updates["day"], is_today, oob=True),
+            fragments.habit_streaks(updates["habit"], oob=True),
+        ]
+        if period_dates:
+            oob_html.append(fragments.habit_rate(updates["habit"], oob=True))
+        # Other pages get the week view button; rates depend on the period each one shows
+        delta_html = [
+            fragments.completion_button(habit, iso_date, completed, user_id, oob=True),
+            *oob_html[:3],
+        ]
+
+    publish_update(request, user_id, "".join(delta_html))
+    return HTMLResponse(str(button_html) + "".join(oob_html))
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(authorization: str | None = Header(None)):
+    """Request, database and cache metrics of this worker in Prometheus text format"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Metrics token required")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
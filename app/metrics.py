@@ -0,0 +1,285 @@
+"""Per-route request metrics in Prometheus text format and a slow-request log"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from jinja2 import Template
+from sqlalchemy import event
+
+from app import database
+from app.cache import habit_row_cache, response_cache
+from app.events import event_broker
+from app.telegram_auth import verified_init_data
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# When set, GET /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_MAX_STATEMENTS = int(os.getenv("SLOW_REQUEST_MAX_STATEMENTS", "50"))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+if not logger.hasHandlers():
+    # uvicorn only configures its own loggers, slow requests would be dropped
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class RequestMetrics:
+    """Counters of the request being served; statements are kept for the slow log"""
+
+    statements: int = 0
+    db_seconds: float = 0.0
+    render_seconds: float = 0.0
+    statement_log: list[tuple[float, str]] = field(default_factory=list)
+
+
+# Set by MetricsMiddleware; threadpool calls made by the request inherit it
+current_request: ContextVar[RequestMetrics | None] = ContextVar("current_request", default=None)
+
+
+@dataclass
+class RouteMetrics:
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(DURATION_BUCKETS) + 1))
+    duration_sum: float = 0.0
+    statements: int = 0
+    db_seconds: float = 0.0
+    render_seconds: float = 0.0
+    statuses: dict[int, int] = field(default_factory=lambda: defaultdict(int))
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets)
+
+
+class MetricsRegistry:
+    """
+    Aggregates finished requests per (method, route template).
+    Each gunicorn worker keeps its own registry, so a scrape sees one worker.
+    """
+
+    def __init__(self):
+        self._routes: dict[tuple[str, str], RouteMetrics] = defaultdict(RouteMetrics)
+        self._lock = threading.Lock()
+
+    def observe(
+        self, method: str, route: str, status: int, duration: float, request: RequestMetrics
+    ):
+        with self._lock:
+            metrics = self._routes[(method, route)]
+            metrics.buckets[bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+            metrics.duration_sum += duration
+            metrics.statements += request.statements
+            metrics.db_seconds += request.db_seconds
+            metrics.render_seconds += request.render_seconds
+            metrics.statuses[status] += 1
+
+    def render(self) -> str:
+        """Returns all metrics in Prometheus text exposition format"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP habits_http_request_duration_seconds Request duration per route",
+                "# TYPE habits_http_request_duration_seconds histogram",
+            ]
+            for (method, route), metrics in routes:
+                labels = f'method="{method}",route="{route}"'
+                cumulative = 0
+                # The last bucket holds requests over every bound, counted by le="+Inf"
+                for bound, count in zip(DURATION_BUCKETS, metrics.buckets[:-1], strict=True):
+                    cumulative += count
+                    lines.append(
+                        f'habits_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'habits_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}'
+                )
+                lines.append(
+                    f"habits_http_request_duration_seconds_sum{{{labels}}} {metrics.duration_sum}"
+                )
+                lines.append(
+                    f"habits_http_request_duration_seconds_count{{{labels}}} {metrics.count}"
+                )
+
+            lines += [
+                "# HELP habits_http_requests_total Finished requests per route and status",
+                "# TYPE habits_http_requests_total counter",
+            ]
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.statuses.items()):
+                    lines.append(
+                        f'habits_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}'
+                    )
+
+            for name, attribute, help_text in (
+                ("habits_db_statements_total", "statements", "SQL statements executed"),
+                ("habits_db_duration_seconds_total", "db_seconds", "Time spent in SQL statements"),
+                (
+                    "habits_template_render_seconds_total",
+                    "render_seconds",
+                    "Time spent rendering templates",
+                ),
+            ):
+                lines += [f"# HELP {name} {help_text} per route", f"# TYPE {name} counter"]
+                for (method, route), metrics in routes:
+                    lines.append(
+                        f'{name}{{method="{method}",route="{route}"}} {getattr(metrics, attribute)}'
+                    )
+
+        cache = response_cache.stats()
+        habit_rows = habit_row_cache.stats()
+        lines += [
+            "# HELP habits_response_cache_requests_total Response cache lookups by result",
+            "# TYPE habits_response_cache_requests_total counter",
+            f'habits_response_cache_requests_total{{result="hit"}} {cache["hits"]}',
+            f'habits_response_cache_requests_total{{result="miss"}} {cache["misses"]}',
+            "# HELP habits_response_cache_entries Cached response bodies",
+            "# TYPE habits_response_cache_entries gauge",
+            f"habits_response_cache_entries {cache['entries']}",
+            "# HELP habits_habit_row_cache_requests_total Rendered habit row cache lookups by result",
+            "# TYPE habits_habit_row_cache_requests_total counter",
+            f'habits_habit_row_cache_requests_total{{result="hit"}} {habit_rows["hits"]}',
+            f'habits_habit_row_cache_requests_total{{result="miss"}} {habit_rows["misses"]}',
+            "# HELP habits_event_streams Open /events connections",
+            "# TYPE habits_event_streams gauge",
+            f"habits_event_streams {event_broker.connections()}",
+            "# HELP habits_auth_cache_requests_total Verified initData cache lookups by result",
+            "# TYPE habits_auth_cache_requests_total counter",
+            f'habits_auth_cache_requests_total{{result="hit"}} {verified_init_data.hits}',
+            f'habits_auth_cache_requests_total{{result="miss"}} {verified_init_data.misses}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+def before_cursor_execute(conn, *_args):
+    if current_request.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, _cursor, statement, *_args):
+    request = current_request.get()
+    if request is None:
+        return
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    request.statements += 1
+    request.db_seconds += elapsed
+    if len(request.statement_log) < SLOW_REQUEST_MAX_STATEMENTS:
+        request.statement_log.append((elapsed, statement))
+
+
+def install_query_listeners():
+    """Times every statement of the app's engines on behalf of the current request"""
+    engines = [database.engine]
+    if database.DB_ASYNC:
+        engines.append(database.async_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+@contextmanager
+def render_timer():
+    """Adds the time of the enclosed template rendering to the current request"""
+    request = current_request.get()
+    if request is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.render_seconds += time.perf_counter() - started
+
+
+class TimedTemplate(Template):
+    """Jinja template class that reports render time; set as environment.template_class"""
+
+    def render(self, *args, **kwargs) -> str:
+        with render_timer():
+            return super().render(*args, **kwargs)
+
+
+def log_slow_request(method: str, path: str, status: int, duration: float, request: RequestMetrics):
+    statements = "\n".join(
+        f"    {elapsed * 1000:7.2f} ms  {' '.join(statement.split())[:300]}"
+        for elapsed, statement in request.statement_log
+    )
+    logger.warning(
+        "Slow request %s %s -> %d: %.1f ms, %d statements in %.1f ms, render %.1f ms\n%s",
+        method,
+        path,
+        status,
+        duration * 1000,
+        request.statements,
+        request.db_seconds * 1000,
+        request.render_seconds * 1000,
+        statements,
+    )
+
+
+class MetricsMiddleware:
+    """Measures every HTTP request and records it under its route template"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: dict | None = None
+
+    def get_route(self, scope) -> str:
+        # The router stores the matched endpoint in scope; unmatched paths share
+        # one label so random URLs can't grow the registry
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = current_request.set(request)
+        status = 500
+        event_stream = False
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                event_stream = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message["headers"]
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            duration = time.perf_counter() - started
+            # An event stream is open as long as the page is; its duration says nothing
+            if not event_stream:
+                metrics_registry.observe(
+                    scope["method"], self.get_route(scope), status, duration, request
+                )
+                if SLOW_REQUEST_MS and duration * 1000 >= SLOW_REQUEST_MS:
+                    log_slow_request(scope["method"], scope["path"], status, duration, request)
@@ -0,0 +1,29 @@
+"""Request and response models of the JSON API"""
+
+import datetime
+
+from pydantic import BaseModel, Field
+
+MAX_BATCH_OPERATIONS = 500
+
+
+class CompletionState(BaseModel):
+    """Completion state of a habit on a date"""
+
+    habit_id: str
+    date: datetime.date
+    completed: bool
+
+
+class CompletionBatch(BaseModel):
+    """Wanted completion states, applied in order"""
+
+    operations: list[CompletionState] = Field(max_length=MAX_BATCH_OPERATIONS)
+
+
+class CompletionBatchResult(BaseModel):
+    """Final states of applied operations and habits that do not belong to user"""
+
+    states: list[CompletionState]
+    not_found: list[str]
+    changed: int
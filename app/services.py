@@ -1,40 +1,137 @@
 """Services for application business logic"""
 
+import datetime
+from collections import Counter
 from datetime import date
 
+from sqlalchemy import case, delete, false, func, insert, select, true, update
 from sqlalchemy.orm import Session
 
-from app.database import CompletionModel
+from app.bitmaps import CompletionBitmap
+from app.database import (
+    CASCADE_DELETES,
+    CompletionModel,
+    DailyRollupModel,
+    HabitModel,
+    HabitStatsModel,
+    add_daily_completions,
+    allocate_habit_number,
+    bump_user_data_version,
+    get_all_habits,
+    get_habit_by_id,
+    get_habits_count_by_user,
+    get_owned_habit_ids,
+    habit_to_dict,
+    set_completion_records,
+    toggle_completion_record,
+)
+from app.utils import (
+    MONTH_NAMES,
+    format_date_for_display,
+    format_epoch_day,
+    from_epoch_day,
+    get_chart_buckets,
+    get_habit_color,
+    get_year_weeks,
+    parse_epoch_day,
+    to_epoch_day,
+)
 
 
-def get_completions_batch(
-    db: Session, user_id: str, habit_ids: list[str], dates: list[str]
-) -> dict[tuple, bool]:
-    """
-    Optimized function to get completions in one query.
-    Returns dictionary {(habit_id, date): True/False}
-    """
-    if not habit_ids or not dates:
-        return {}
+def get_completed_days(
+    db: Session, user_id: str, habit_ids: list[str], start_day: int, end_day: int
+) -> list[tuple[str, int]]:
+    """Gets (habit_id, day) pairs completed between start_day and end_day inclusive"""
+    if not habit_ids:
+        return []
 
-    completions = (
-        db.query(CompletionModel)
+    return (
+        db.query(CompletionModel.habit_id, CompletionModel.day)
         .filter(
             CompletionModel.user_id == user_id,
             CompletionModel.habit_id.in_(habit_ids),
-            CompletionModel.date.in_(dates),
+            CompletionModel.day.between(start_day, end_day),
         )
         .all()
     )
 
-    completion_set = {(c.habit_id, c.date) for c in completions}
 
-    result = {}
-    for habit_id in habit_ids:
-        for date_str in dates:
-            result[(habit_id, date_str)] = (habit_id, date_str) in completion_set
+def get_daily_completion_counts(
+    db: Session, user_id: str, start_day: int, end_day: int
+) -> dict[int, int]:
+    """
+    Gets completions of the user's non-archived habits per day between
+    start_day and end_day inclusive from the daily rollup, at most one row
+    per day; days without completions may be absent
+    """
+    rows = db.query(DailyRollupModel.day, DailyRollupModel.completed_count).filter(
+        DailyRollupModel.user_id == user_id,
+        DailyRollupModel.day.between(start_day, end_day),
+    )
+    return dict(rows.all())
 
-    return result
+
+def count_daily_completions(user_id: str | None = None):
+    """SELECT of (user_id, day, completed_count) counted from the completions themselves"""
+    query = (
+        select(CompletionModel.user_id, CompletionModel.day, func.count(CompletionModel.id))
+        .join(HabitModel, HabitModel.id == CompletionModel.habit_id)
+        .where(HabitModel.archived == false())
+        .group_by(CompletionModel.user_id, CompletionModel.day)
+    )
+    if user_id is not None:
+        query = query.where(CompletionModel.user_id == user_id)
+    return query
+
+
+def rebuild_daily_rollup(db: Session, user_id: str | None = None) -> int:
+    """
+    Recomputes the daily rollup of one user, or of everyone, from completions
+    with a single INSERT ... SELECT; returns the number of rows written.
+    Bumps the data version of every user whose rows were rebuilt, so cached
+    fragments and ETags of all workers stop serving the old counts.
+    """
+    rollup = delete(DailyRollupModel)
+    rollup_users = select(DailyRollupModel.user_id).distinct()
+    if user_id is not None:
+        rollup = rollup.where(DailyRollupModel.user_id == user_id)
+        users = {user_id}
+    else:
+        users = set(db.scalars(rollup_users))
+    db.execute(rollup)
+    written = db.execute(
+        insert(DailyRollupModel).from_select(
+            ["user_id", "day", "completed_count"], count_daily_completions(user_id)
+        )
+    ).rowcount
+    if user_id is None:
+        users.update(db.scalars(rollup_users))
+    for rebuilt_user_id in users:
+        bump_user_data_version(db, rebuilt_user_id)
+    db.commit()
+    return written
+
+
+def check_daily_rollup(db: Session, user_id: str | None = None) -> list[tuple[str, int, int, int]]:
+    """
+    Compares the daily rollup with counts from completions.
+    Returns (user_id, day, stored, actual) of every day that differs.
+    """
+    actual = {
+        (user, day): count for user, day, count in db.execute(count_daily_completions(user_id))
+    }
+    stored_query = select(
+        DailyRollupModel.user_id, DailyRollupModel.day, DailyRollupModel.completed_count
+    )
+    if user_id is not None:
+        stored_query = stored_query.where(DailyRollupModel.user_id == user_id)
+    stored = {(user, day): count for user, day, count in db.execute(stored_query) if count}
+
+    return [
+        (user, day, stored.get((user, day), 0), actual.get((user, day), 0))
+        for user, day in sorted(stored.keys() | actual.keys())
+        if stored.get((user, day), 0) != actual.get((user, day), 0)
+    ]
 
 
 def enrich_habits_with_completions(
@@ -44,78 +141,441 @@ def enrich_habits_with_completions(
         return []
 
     habit_ids = [h["id"] for h in habits]
-    completions_map = get_completions_batch(db, user_id, habit_ids, dates)
+    days = [parse_epoch_day(date_str) for date_str in dates]
+    # One bitmap per habit instead of a {(habit_id, day): bool} entry per pair
+    bitmaps = get_completion_bitmaps(db, user_id, habit_ids, min(days), max(days)) if days else {}
 
     enriched_habits = []
     for habit in habits:
-        habit_completions = {
-            date_str: completions_map.get((habit["id"], date_str), False) for date_str in dates
-        }
+        bitmap = bitmaps.get(habit["id"], CompletionBitmap())
+        habit_completions = dict(zip(dates, bitmap.completed_flags(days), strict=True))
         enriched_habits.append({**habit, "completions": habit_completions})
 
     return enriched_habits
 
 
-def calculate_streaks(
-    db: Session, user_id: str, habit_id: str, dates: list[date]
-) -> dict[str, int]:
+def get_completion_bitmaps(
+    db: Session, user_id: str, habit_ids: list[str], start_day: int, end_day: int
+) -> dict[str, CompletionBitmap]:
+    """Gets completion bitmap per habit for days between start_day and end_day inclusive"""
+    days_by_habit: dict[str, list[int]] = {habit_id: [] for habit_id in habit_ids}
+    for habit_id, day in get_completed_days(db, user_id, habit_ids, start_day, end_day):
+        days_by_habit[habit_id].append(day)
+
+    return {
+        habit_id: CompletionBitmap.from_days(days, origin=start_day)
+        for habit_id, days in days_by_habit.items()
+    }
+
+
+def compute_habit_stats(days: list[int]) -> dict[str, int | None]:
+    """Computes all-time statistics from every completed epoch day of a habit"""
+    if not days:
+        return {
+            "total_completions": 0,
+            "best_streak": 0,
+            "last_completion_day": None,
+            "last_streak": 0,
+        }
+
+    first_day, last_day = min(days), max(days)
+    bitmap = CompletionBitmap.from_days(days, origin=first_day)
+    return {
+        "total_completions": len(bitmap),
+        "best_streak": bitmap.longest_streak(first_day, last_day),
+        "last_completion_day": last_day,
+        "last_streak": bitmap.current_streak(first_day, last_day),
+    }
+
+
+def rebuild_habit_stats(db: Session, user_id: str, habit_id: str) -> HabitStatsModel:
+    """Recomputes habit statistics from its full completion history"""
+    days = [
+        day
+        for (day,) in db.query(CompletionModel.day).filter(
+            CompletionModel.user_id == user_id, CompletionModel.habit_id == habit_id
+        )
+    ]
+    stats = db.get(HabitStatsModel, habit_id)
+    if stats is None:
+        stats = HabitStatsModel(habit_id=habit_id, user_id=user_id)
+        db.add(stats)
+    for field, value in compute_habit_stats(days).items():
+        setattr(stats, field, value)
+    return stats
+
+
+def update_habit_stats(db: Session, user_id: str, habit_id: str, day: int, completed: bool):
     """
-    Calculates current and maximum streaks for habit.
-    Returns {'current_streak': int, 'max_streak': int}
+    Updates habit statistics after completion of day was toggled.
+    Appending to or trimming the latest streak is applied incrementally;
+    any other change (back-filling history, breaking a streak in the middle)
+    falls back to a rebuild from the habit's history.
     """
-    if not dates:
-        return {"current_streak": 0, "max_streak": 0}
+    stats = db.get(HabitStatsModel, habit_id)
+    if stats is None:
+        rebuild_habit_stats(db, user_id, habit_id)
+        return
 
-    date_strs = [d.strftime("%Y-%m-%d") for d in dates]
-    completions = (
-        db.query(CompletionModel)
-        .filter(
-            CompletionModel.user_id == user_id,
-            CompletionModel.habit_id == habit_id,
-            CompletionModel.date.in_(date_strs),
+    last_day = stats.last_completion_day
+    if completed and last_day is None:
+        stats.last_streak = stats.best_streak = stats.total_completions = 1
+        stats.last_completion_day = day
+    elif completed and day > last_day:
+        stats.last_streak = stats.last_streak + 1 if day == last_day + 1 else 1
+        stats.last_completion_day = day
+        stats.total_completions += 1
+        stats.best_streak = max(stats.best_streak, stats.last_streak)
+    elif not completed and day == last_day and 1 < stats.last_streak < stats.best_streak:
+        stats.last_streak -= 1
+        stats.last_completion_day = day - 1
+        stats.total_completions -= 1
+    else:
+        rebuild_habit_stats(db, user_id, habit_id)
+
+
+def get_habit_stats(
+    db: Session, user_id: str, habit_ids: list[str], today_day: int
+) -> dict[str, dict[str, int | None]]:
+    """
+    Gets all-time statistics per habit with one query.
+    Returns {habit_id: {'current_streak', 'best_streak', 'total_completions',
+    'last_completion_day'}}; stats missing for older habits are backfilled.
+    """
+    if not habit_ids:
+        return {}
+
+    stats_by_habit = {
+        stats.habit_id: stats
+        for stats in db.query(HabitStatsModel).filter(
+            HabitStatsModel.user_id == user_id, HabitStatsModel.habit_id.in_(habit_ids)
         )
-        .all()
+    }
+    missing = [habit_id for habit_id in habit_ids if habit_id not in stats_by_habit]
+    for habit_id in missing:
+        stats_by_habit[habit_id] = rebuild_habit_stats(db, user_id, habit_id)
+    if missing:
+        db.commit()
+
+    result = {}
+    for habit_id, stats in stats_by_habit.items():
+        current_streak = 0
+        if stats.last_completion_day is not None:
+            streak_start = stats.last_completion_day - stats.last_streak + 1
+            if streak_start <= today_day <= stats.last_completion_day:
+                current_streak = today_day - streak_start + 1
+        result[habit_id] = {
+            "current_streak": current_streak,
+            "best_streak": stats.best_streak,
+            "total_completions": stats.total_completions,
+            "last_completion_day": stats.last_completion_day,
+        }
+    return result
+
+
+def enrich_habit_with_stats(habit: dict, habit_stats: dict, completion_rate: int | None) -> dict:
+    """Adds report fields (period rate, streaks, totals) to habit"""
+    last_day = habit_stats["last_completion_day"]
+    return {
+        **habit,
+        "completion_rate": completion_rate,
+        "current_streak": habit_stats["current_streak"],
+        "max_streak": habit_stats["best_streak"],
+        "total_completions": habit_stats["total_completions"],
+        "last_completion_date": (
+            format_date_for_display(from_epoch_day(last_day)) if last_day is not None else None
+        ),
+    }
+
+
+def summarize_day(completed_count: int, habits_count: int) -> dict[str, int]:
+    """Builds calendar summary of one day"""
+    return {
+        "completed": completed_count,
+        "total": habits_count,
+        "percentage": round(completed_count / habits_count * 100) if habits_count else 0,
+    }
+
+
+def build_report(db: Session, user_id: str, habits: list[dict], dates: list[date]) -> dict:
+    """
+    Builds report for period with a single completions query.
+    Returns {'chart': dict, 'habits': list[dict]} where habits are enriched
+    with period completion rate and all-time streaks. The chart is columnar,
+    one point per day, week or month depending on the period length:
+    {'bucket', 'labels', 'days' per point, 'total' completions per point,
+    'habits': completed days per point, one list per habit in habits order}.
+    """
+    if not habits or not dates:
+        return {"chart": None, "habits": []}
+
+    days = [to_epoch_day(d) for d in dates]
+    start_day, end_day = min(days), max(days)
+    habit_ids = [h["id"] for h in habits]
+    bitmaps = get_completion_bitmaps(db, user_id, habit_ids, start_day, end_day)
+    stats = get_habit_stats(db, user_id, habit_ids, to_epoch_day(date.today()))
+
+    bucket, buckets = get_chart_buckets(dates[0], dates[-1])
+    bounds = [(to_epoch_day(first), to_epoch_day(last)) for _, first, last in buckets]
+    totals = get_daily_completion_counts(db, user_id, start_day, end_day)
+    chart = {
+        "bucket": bucket,
+        "labels": [label for label, _, _ in buckets],
+        "days": [last - first + 1 for first, last in bounds],
+        "total": [
+            sum(totals.get(day, 0) for day in range(first, last + 1)) for first, last in bounds
+        ],
+        "habits": [bitmaps[habit["id"]].bucket_counts(bounds) for habit in habits],
+    }
+
+    habits_with_stats = [
+        enrich_habit_with_stats(
+            habit,
+            stats[habit["id"]],
+            bitmaps[habit["id"]].completion_rate(start_day, end_day),
+        )
+        for habit in habits
+    ]
+
+    return {"chart": chart, "habits": habits_with_stats}
+
+
+def load_week_habits(db: Session, user_id: str, week_days: list[str]) -> list[dict]:
+    """Gets user habits enriched with completions for week days"""
+    habits = get_all_habits(db, user_id)
+    return enrich_habits_with_completions(db, user_id, habits, week_days)
+
+
+def load_calendar(db: Session, user_id: str, month_days: list[int]) -> dict:
+    """
+    Gets user habits and per-day completion summary for month.
+    Returns {'habits': list[dict], 'day_completions': {date_str: {...}}}
+    """
+    habits = get_all_habits(db, user_id)
+
+    counts = (
+        get_daily_completion_counts(db, user_id, min(month_days), max(month_days))
+        if habits and month_days
+        else {}
     )
+    day_completions = {
+        format_epoch_day(day): summarize_day(counts.get(day, 0), len(habits)) for day in month_days
+    }
+    return {"habits": habits, "day_completions": day_completions}
 
-    completion_set = {c.date for c in completions}
 
-    sorted_dates = sorted(dates, reverse=True)
+def load_heatmap(db: Session, user_id: str, year: int) -> dict:
+    """
+    Gets per-day completion summaries of a year for the heatmap from at most
+    366 daily rollup rows. Returns {'weeks': columns of 7 (date_str, summary)
+    cells or None outside the year, 'months': month label per week or None}.
+    """
+    start_day, end_day = to_epoch_day(date(year, 1, 1)), to_epoch_day(date(year, 12, 31))
+    counts = get_daily_completion_counts(db, user_id, start_day, end_day)
+    habits_count = get_habits_count_by_user(db, user_id)
 
-    current_streak = 0
-    for d in sorted_dates:
-        date_str = d.strftime("%Y-%m-%d")
-        if date_str in completion_set:
-            current_streak += 1
-        else:
-            break
-
-    max_streak = 0
-    temp_streak = 0
-    for d in sorted_dates:
-        date_str = d.strftime("%Y-%m-%d")
-        if date_str in completion_set:
-            temp_streak += 1
-            max_streak = max(max_streak, temp_streak)
-        else:
-            temp_streak = 0
+    weeks, months = [], []
+    for week in get_year_weeks(year):
+        weeks.append(
+            [
+                (
+                    (d.isoformat(), summarize_day(counts.get(to_epoch_day(d), 0), habits_count))
+                    if d
+                    else None
+                )
+                for d in week
+            ]
+        )
+        first_of_month = next((d for d in week if d and d.day == 1), None)
+        months.append(MONTH_NAMES[first_of_month.month] if first_of_month else None)
+    return {"weeks": weeks, "months": months}
 
-    return {"current_streak": current_streak, "max_streak": max_streak}
 
+def load_report(db: Session, user_id: str, dates: list[date]) -> dict:
+    """Gets user habits and builds report for period"""
+    habits = get_all_habits(db, user_id)
+    return build_report(db, user_id, habits, dates)
 
-def calculate_completion_rate(db: Session, user_id: str, habit_id: str, dates: list[date]) -> int:
-    """Calculates habit completion rate for period"""
-    if not dates:
-        return 0
 
-    date_strs = [d.strftime("%Y-%m-%d") for d in dates]
-    completed_count = (
-        db.query(CompletionModel)
-        .filter(
-            CompletionModel.user_id == user_id,
-            CompletionModel.habit_id == habit_id,
-            CompletionModel.date.in_(date_strs),
+def build_habit(user_id: str, habit_number: int, habits_count: int, name: str) -> HabitModel:
+    """Builds habit with id {user_id}_{habit_number}, colored by its position among user habits"""
+    return HabitModel(
+        id=f"{user_id}_{habit_number}",
+        user_id=user_id,
+        name=name,
+        color=get_habit_color(habits_count),
+        created_at=datetime.datetime.now(),
+    )
+
+
+def create_habit(db: Session, user_id: str, name: str, week_days: list[str]) -> list[dict]:
+    """
+    Creates habit with next per-user id and returns user habits, the new one
+    included, enriched with completions for week days
+    """
+    habits = get_all_habits(db, user_id)
+    habit = build_habit(user_id, allocate_habit_number(db, user_id), len(habits), name)
+    db.add(habit)
+    habits.append(habit_to_dict(habit))
+    bump_user_data_version(db, user_id)
+    db.commit()
+
+    return enrich_habits_with_completions(db, user_id, habits, week_days)
+
+
+def remove_habit(db: Session, user_id: str, habit_id: str) -> bool:
+    """
+    Removes habit from user's lists and its completions from the daily
+    rollup, returns False if not found. In archive mode this is a single-row
+    UPDATE and completions are left to purge_archived_habits(); in cascade
+    mode the database deletes them.
+    """
+    habit_filter = (
+        HabitModel.id == habit_id,
+        HabitModel.user_id == user_id,
+        HabitModel.archived == false(),
+    )
+    # Its completions stop counting at once, whether they are purged later or cascade now
+    habit_days = (
+        select(CompletionModel.day)
+        .join(HabitModel, HabitModel.id == CompletionModel.habit_id)
+        .where(CompletionModel.user_id == user_id, *habit_filter)
+    )
+    db.execute(
+        update(DailyRollupModel)
+        .where(DailyRollupModel.user_id == user_id, DailyRollupModel.day.in_(habit_days))
+        .values(
+            completed_count=case(
+                (DailyRollupModel.completed_count > 1, DailyRollupModel.completed_count - 1),
+                else_=0,
+            )
         )
-        .count()
     )
+    if CASCADE_DELETES:
+        removed = db.execute(delete(HabitModel).where(*habit_filter)).rowcount
+    else:
+        removed = db.execute(
+            update(HabitModel)
+            .where(*habit_filter)
+            .values(archived=True, archived_at=datetime.datetime.now())
+        ).rowcount
+    if removed:
+        bump_user_data_version(db, user_id)
+    db.commit()
+    return bool(removed)
+
+
+def purge_archived_habits(db: Session, batch_size: int, max_batches: int | None = None) -> dict:
+    """
+    Deletes completions and statistics of archived habits, then the habits.
+    Completions go in batches of batch_size rows, each in its own short
+    transaction, so the SQLite write lock is never held for long.
+    Stops after max_batches batches; returns {'habits', 'completions'} purged.
+    """
+    purged = {"habits": 0, "completions": 0}
+    batches = 0
+    archived = db.query(HabitModel.id, HabitModel.user_id).filter(HabitModel.archived == true())
+    for habit_id, user_id in archived.all():
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                return purged
+            batch = (
+                select(CompletionModel.id)
+                .where(CompletionModel.user_id == user_id, CompletionModel.habit_id == habit_id)
+                .limit(batch_size)
+            )
+            deleted = db.execute(
+                delete(CompletionModel).where(CompletionModel.id.in_(batch.scalar_subquery()))
+            ).rowcount
+            db.commit()
+            batches += 1
+            purged["completions"] += deleted
+            if deleted < batch_size:
+                break
+
+        db.execute(delete(HabitStatsModel).where(HabitStatsModel.habit_id == habit_id))
+        db.execute(
+            delete(HabitModel).where(HabitModel.id == habit_id, HabitModel.archived == true())
+        )
+        db.commit()
+        purged["habits"] += 1
+    return purged
 
-    return round((completed_count / len(dates)) * 100)
+
+def toggle_habit_completion(
+    db: Session, user_id: str, habit_id: str, day: int
+) -> tuple[dict | None, bool]:
+    """
+    Toggles habit completion for epoch day and updates habit statistics.
+    Returns (habit, completed); habit is None if it does not belong to user.
+    """
+    habit = get_habit_by_id(db, user_id, habit_id)
+    if habit is None:
+        return None, False
+
+    completed, changed = toggle_completion_record(db, user_id, habit_id, day)
+    if changed:
+        update_habit_stats(db, user_id, habit_id, day, completed)
+        add_daily_completions(db, user_id, {day: 1 if completed else -1})
+    bump_user_data_version(db, user_id)
+    db.commit()
+    return habit, completed
+
+
+def load_toggle_updates(
+    db: Session, user_id: str, habit: dict, day: int, period_dates: list[date] | None
+) -> dict:
+    """
+    Recomputes only what a completion toggle changed, for out-of-band updates.
+    Returns {'day': calendar summary of day, 'habit': habit with report fields};
+    completion_rate is None when no report period is given.
+    """
+    completed_count = get_daily_completion_counts(db, user_id, day, day).get(day, 0)
+    day_summary = summarize_day(completed_count, get_habits_count_by_user(db, user_id))
+
+    completion_rate = None
+    if period_dates:
+        start_day, end_day = to_epoch_day(period_dates[0]), to_epoch_day(period_dates[-1])
+        bitmap = get_completion_bitmaps(db, user_id, [habit["id"]], start_day, end_day)
+        completion_rate = bitmap[habit["id"]].completion_rate(start_day, end_day)
+
+    stats = get_habit_stats(db, user_id, [habit["id"]], to_epoch_day(date.today()))
+    return {
+        "day": day_summary,
+        "habit": enrich_habit_with_stats(habit, stats[habit["id"]], completion_rate),
+    }
+
+
+def set_habit_completions(
+    db: Session, user_id: str, operations: list[tuple[str, int, bool]]
+) -> dict:
+    """
+    Applies (habit_id, day, completed) operations in one transaction.
+    Operations set state rather than toggle, so replaying a batch is harmless;
+    for repeated (habit_id, day) pairs the last operation wins.
+    Returns {'states': {(habit_id, day): completed}, 'not_found': [habit_id],
+    'changed': number of rows inserted or deleted}.
+    """
+    owned = get_owned_habit_ids(db, user_id, list({habit_id for habit_id, _, _ in operations}))
+    states = {
+        (habit_id, day): completed for habit_id, day, completed in operations if habit_id in owned
+    }
+    not_found = sorted({habit_id for habit_id, _, _ in operations if habit_id not in owned})
+
+    changes = set_completion_records(db, user_id, states)
+    changes_by_habit: dict[str, list[tuple[int, bool]]] = {}
+    daily_deltas: Counter[int] = Counter()
+    for habit_id, day, completed in changes:
+        changes_by_habit.setdefault(habit_id, []).append((day, completed))
+        daily_deltas[day] += 1 if completed else -1
+    add_daily_completions(db, user_id, daily_deltas)
+    for habit_id, habit_changes in changes_by_habit.items():
+        if len(habit_changes) == 1:
+            update_habit_stats(db, user_id, habit_id, *habit_changes[0])
+        else:
+            # One history read instead of a chain of incremental updates
+            rebuild_habit_stats(db, user_id, habit_id)
+    if changes:
+        bump_user_data_version(db, user_id)
+    db.commit()
+    return {"states": states, "not_found": not_found, "changed": len(changes)}
@@ -2,69 +2,316 @@
 Module for Telegram Mini Apps authentication
 """
 
+import base64
+import hashlib
+import hmac
 import json
 import os
+import threading
+import time
 import urllib.parse
+from collections import OrderedDict
+from functools import lru_cache
 
-from fastapi import HTTPException, Query, Request
+from fastapi import Form, HTTPException, Query, Request
 
+TELEGRAM_AUTH_MAX_AGE = int(os.getenv("TELEGRAM_AUTH_MAX_AGE", "86400"))
+TELEGRAM_AUTH_CACHE_SIZE = int(os.getenv("TELEGRAM_AUTH_CACHE_SIZE", "4096"))
+SESSION_COOKIE_NAME = os.getenv("SESSION_COOKIE_NAME", "habits_session")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "true").lower() == "true"
+EVENTS_TOKEN_TTL = int(os.getenv("EVENTS_TOKEN_TTL", "86400"))
 
-def get_user_id_from_query(request: Request) -> str:
+INIT_DATA_HEADER = "x-telegram-init-data"
+# The session cookie is SameSite=None (Telegram Web runs the app in a cross-site
+# iframe), so a cross-site form could send it; other methods need the initData header,
+# which a cross-site page can't set
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+EVENTS_TOKEN_SCOPE = "events"
+
+
+def get_bot_token() -> str:
+    # Read on every call: .env is loaded by app.main after this module is imported
+    return os.getenv("TELEGRAM_BOT_TOKEN", "")
+
+
+def allow_default_user() -> bool:
+    return os.getenv("ALLOW_DEFAULT_USER", "false").lower() == "true"
+
+
+@lru_cache(maxsize=4)
+def get_init_data_secret(bot_token: str) -> bytes:
+    """Secret key of initData signatures: HMAC-SHA256 of the bot token keyed by "WebAppData" """
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=4)
+def get_session_secret(bot_token: str) -> bytes:
+    """Key of session cookie signatures; SESSION_SECRET or one derived from the bot token"""
+    secret = os.getenv("SESSION_SECRET")
+    if secret:
+        return secret.encode()
+    return hmac.new(b"CloudHabitsSession", bot_token.encode(), hashlib.sha256).digest()
+
+
+def validate_telegram_init_data(
+    init_data: str, bot_token: str, max_age: int = TELEGRAM_AUTH_MAX_AGE
+) -> dict | None:
+    """
+    Checks Telegram WebApp initData as described in
+    https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app:
+    the hash field must equal HMAC-SHA256 of the other fields (sorted key=value
+    lines) keyed by the bot's secret, and auth_date must be at most max_age
+    seconds old. Returns the fields with "user" decoded, or None if invalid.
+    """
+    try:
+        fields = dict(urllib.parse.parse_qsl(init_data, strict_parsing=True))
+        received_hash = fields.pop("hash")
+        data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+        expected_hash = hmac.new(
+            get_init_data_secret(bot_token), data_check_string.encode(), hashlib.sha256
+        ).hexdigest()
+        if not hmac.compare_digest(expected_hash, received_hash):
+            return None
+
+        auth_date = int(fields["auth_date"])
+        if max_age and time.time() - auth_date > max_age:
+            return None
+
+        fields["auth_date"] = auth_date
+        fields["user"] = json.loads(fields["user"])
+        if "id" not in fields["user"]:
+            return None
+    except (KeyError, ValueError, TypeError):
+        return None
+    else:
+        return fields
+
+
+class VerifiedInitDataCache:
     """
-    Gets user_id from query parameters.
-    Telegram Mini Apps pass user_id via ?user_id=... parameter
+    LRU of initData strings that passed validation, keyed by a digest of the
+    string, holding (user_id, auth_date). A hit costs one blake2b instead of
+    parsing, sorting and two HMACs; auth_date is still checked on every hit.
     """
-    user_id = request.query_params.get("user_id")
-    if not user_id:
-        # For development, test ID can be used
-        # In production this should be required
-        raise HTTPException(
-            status_code=401, detail="user_id is required. Please provide ?user_id=... in URL"
-        )
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[str, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(
+        self, init_data: str, bot_token: str, max_age: int = TELEGRAM_AUTH_MAX_AGE
+    ) -> str | None:
+        """Returns the Telegram user id of valid initData, None otherwise"""
+        key = hashlib.blake2b(init_data.encode(), digest_size=16).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            user_id, auth_date = entry
+            if not max_age or time.time() - auth_date <= max_age:
+                self.hits += 1
+                return user_id
+            with self._lock:
+                self._entries.pop(key, None)
+
+        self.misses += 1
+        data = validate_telegram_init_data(init_data, bot_token, max_age)
+        if data is None:
+            # Invalid input is not cached, it would let garbage evict valid entries
+            return None
+        user_id = str(data["user"]["id"])
+        with self._lock:
+            self._entries[key] = (user_id, data["auth_date"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return user_id
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_init_data = VerifiedInitDataCache(TELEGRAM_AUTH_CACHE_SIZE)
+
+
+def get_session_signature(payload: str, bot_token: str, scope: str = "") -> str:
+    message = f"{scope}:{payload}" if scope else payload
+    signature = hmac.new(get_session_secret(bot_token), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(signature).rstrip(b"=").decode()
+
+
+def sign_session(user_id: str, bot_token: str, ttl: int = SESSION_TTL, scope: str = "") -> str:
+    """
+    Returns session cookie value "{user_id}.{expires}.{signature}".
+    A token signed with a scope (e.g. EVENTS_TOKEN_SCOPE) is only valid for that scope.
+    """
+    payload = f"{user_id}.{int(time.time()) + ttl}"
+    return f"{payload}.{get_session_signature(payload, bot_token, scope)}"
+
+
+def verify_session(cookie: str, bot_token: str, scope: str = "") -> str | None:
+    """Returns user_id of a session cookie with a valid signature that has not expired"""
+    try:
+        payload, signature = cookie.rsplit(".", 1)
+        user_id, expires = payload.rsplit(".", 1)
+        if int(expires) < time.time():
+            return None
+    except ValueError:
+        return None
+    expected = get_session_signature(payload, bot_token, scope)
+    if not hmac.compare_digest(expected, signature):
+        return None
     return user_id
 
 
+def sign_events_token(user_id: str) -> str | None:
+    """
+    Token for GET /events?token=: EventSource can't send the initData header,
+    so the stream still works when the session cookie is blocked.
+    None without TELEGRAM_BOT_TOKEN (development), where ?user_id= is trusted.
+    """
+    bot_token = get_bot_token()
+    if not bot_token:
+        return None
+    return sign_session(user_id, bot_token, EVENTS_TOKEN_TTL, scope=EVENTS_TOKEN_SCOPE)
+
+
+def get_unverified_init_data_user_id(init_data: str) -> str | None:
+    """Reads user id from initData without checking it (no bot token configured)"""
+    try:
+        parsed = urllib.parse.parse_qs(init_data)
+        return str(json.loads(parsed["user"][0])["id"])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def authenticate_request(request: Request, claimed_user_id: str | None) -> str | None:
+    """
+    Resolves the user of a request. With TELEGRAM_BOT_TOKEN set, the identity
+    comes from the signed session cookie or, failing that, from initData
+    (X-Telegram-Init-Data header or ?tgWebAppData=), which also issues a new
+    session; a user_id sent by the client must then match it. Requests other
+    than GET/HEAD/OPTIONS are only authenticated by the initData header, so a
+    cross-site request carrying the cookie can't change data. Without a token
+    (development) the claimed user_id is trusted as before.
+    Returns None if the request carries no usable identity.
+    """
+    bot_token = get_bot_token()
+
+    def get_init_data() -> str | None:
+        return request.headers.get(INIT_DATA_HEADER) or request.query_params.get("tgWebAppData")
+
+    if not bot_token:
+        if claimed_user_id:
+            return claimed_user_id
+        init_data = get_init_data()
+        return get_unverified_init_data_user_id(init_data) if init_data else None
+
+    if request.method in SAFE_METHODS:
+        cookie = request.cookies.get(SESSION_COOKIE_NAME)
+        user_id = verify_session(cookie, bot_token) if cookie else None
+        init_data = get_init_data() if user_id is None else None
+    else:
+        user_id = None
+        init_data = request.headers.get(INIT_DATA_HEADER)
+    if init_data:
+        user_id = verified_init_data.verify(init_data, bot_token)
+        if user_id is not None:
+            # Sent by SessionCookieMiddleware with the response
+            request.state.session_cookie = sign_session(user_id, bot_token)
+
+    if user_id is None:
+        # Explicit development override, e.g. ?user_id=demo_user
+        return claimed_user_id if allow_default_user() else None
+    if claimed_user_id and claimed_user_id != user_id:
+        raise HTTPException(status_code=403, detail="user_id does not match Telegram session")
+    return user_id
+
+
+def resolve_user_id(request: Request, claimed_user_id: str | None) -> str:
+    user_id = authenticate_request(request, claimed_user_id)
+    if user_id:
+        return user_id
+    if allow_default_user():
+        return "default_user"
+    raise HTTPException(status_code=401, detail="Telegram authentication required")
+
+
 def get_user_id_dependency(
     request: Request, user_id: str | None = Query(None, description="Telegram user ID")
 ):
     """
-    Dependency to get user_id from query parameters or Telegram initData.
-    Used in FastAPI Depends().
+    Dependency to get the authenticated user_id. Used in FastAPI Depends().
 
-    Tries to extract user_id from:
-    1. Query parameter ?user_id=...
-    2. Telegram initData in query (?tgWebAppData=...)
-    3. Development mode (ALLOW_DEFAULT_USER=true)
+    Tries, in order:
+    1. Signed session cookie (GET/HEAD/OPTIONS only)
+    2. Telegram initData (X-Telegram-Init-Data header, or ?tgWebAppData=... on reads)
+    3. Query parameter ?user_id=... (only without TELEGRAM_BOT_TOKEN or with ALLOW_DEFAULT_USER)
+    4. Development mode (ALLOW_DEFAULT_USER=true)
     """
+    return resolve_user_id(request, user_id)
 
-    if user_id:
-        return user_id
 
-    init_data = request.query_params.get("tgWebAppData")
-    if init_data:
-        try:
-            # Parse Telegram initData
-            parsed = urllib.parse.parse_qs(init_data)
-            if "user" in parsed:
-                user_json = json.loads(parsed["user"][0])
-                if "id" in user_json:
-                    return str(user_json["id"])
-        except Exception:
-            pass
-
-    allow_default = os.getenv("ALLOW_DEFAULT_USER", "false").lower() == "true"
-    if allow_default:
-        return "default_user"
+def get_form_user_id_dependency(request: Request, user_id: str | None = Form(None)):
+    """Same as get_user_id_dependency for endpoints that receive user_id as a form field"""
+    return resolve_user_id(request, user_id)
 
-    raise HTTPException(status_code=401, detail="user_id parameter is required")
 
+def get_events_user_id_dependency(
+    request: Request,
+    user_id: str | None = Query(None, description="Telegram user ID"),
+    token: str | None = Query(None, description="Token from sign_events_token()"),
+):
+    """Same as get_user_id_dependency, also accepting the ?token= of GET /events"""
+    bot_token = get_bot_token()
+    token_user_id = (
+        verify_session(token, bot_token, scope=EVENTS_TOKEN_SCOPE) if token and bot_token else None
+    )
+    if token_user_id is None:
+        return resolve_user_id(request, user_id)
+    if user_id and user_id != token_user_id:
+        raise HTTPException(status_code=403, detail="user_id does not match events token")
+    return token_user_id
 
-def validate_telegram_init_data(init_data: str, bot_token: str) -> dict | None:
-    try:
-        parsed_data = urllib.parse.parse_qs(init_data)
-        if "user" not in parsed_data:
-            return None
 
-        return None  # TODO:
-    except Exception:
-        return None
+def get_optional_user_id_dependency(
+    request: Request, user_id: str | None = Query(None, description="Telegram user ID")
+):
+    """Same as get_user_id_dependency, but returns None instead of 401 for anonymous requests"""
+    return authenticate_request(request, user_id)
+
+
+class SessionCookieMiddleware:
+    """Sets the session cookie issued while authenticating the request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                session_cookie = scope.get("state", {}).get("session_cookie")
+                if session_cookie:
+                    attributes = (
+                        "Secure; SameSite=None" if SESSION_COOKIE_SECURE else "SameSite=Lax"
+                    )
+                    cookie = (
+                        f"{SESSION_COOKIE_NAME}={session_cookie}; Max-Age={SESSION_TTL}; "
+                        f"Path=/; HttpOnly; {attributes}"
+                    )
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"set-cookie", cookie.encode("latin-1")),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
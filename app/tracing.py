@@ -0,0 +1,68 @@
+"""Sampled debug tracing for hot endpoints"""
+
+import logging
+import os
+import random
+import time
+from pathlib import Path
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_CONTROL_FILE = os.getenv("TRACE_CONTROL_FILE", "")
+
+
+class SampledTracer:
+    """
+    Logs a fraction of requests instead of every one.
+    The rate can be changed at runtime with set_rate() or, for all workers
+    at once, by writing a number between 0 and 1 to the control file,
+    which is re-read at most once per check_interval seconds.
+    """
+
+    def __init__(
+        self, name: str, rate: float = 0.0, control_file: str = "", check_interval: float = 1.0
+    ):
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.hasHandlers():
+            # uvicorn only configures its own loggers, traces would be dropped
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+            self.logger.addHandler(handler)
+        self.rate = rate
+        self.control_file = control_file
+        self.check_interval = check_interval
+        self._next_check = 0.0
+        self._control_mtime: float | None = None
+
+    def set_rate(self, rate: float):
+        self.rate = min(max(rate, 0.0), 1.0)
+
+    def _reload_control_file(self):
+        try:
+            mtime = Path(self.control_file).stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+        try:
+            self.set_rate(float(Path(self.control_file).read_text().strip() or 0))
+        except (OSError, ValueError):
+            self.logger.warning("Ignoring invalid trace control file %s", self.control_file)
+
+    def sampled(self) -> bool:
+        """Returns True when the current request should be traced"""
+        if self.control_file:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self._reload_control_file()
+        return self.rate > 0 and random.random() < self.rate
+
+    def trace(self, msg: str, *args):
+        self.logger.info(msg, *args)
+
+
+completions_tracer = SampledTracer(
+    "app.trace.completions", rate=TRACE_SAMPLE_RATE, control_file=TRACE_CONTROL_FILE
+)
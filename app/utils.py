@@ -31,6 +31,37 @@ MONTH_NAMES = {
 }
 
 
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Report periods of the last N days, today included
+ROLLING_PERIODS = {"7days": 7, "30days": 30, "90days": 90, "365days": 365}
+# Longest custom report range; charts beyond a few months are downsampled anyway
+REPORT_MAX_DAYS = 366 * 5
+# Report chart points are days up to this many days, weeks up to a year, months beyond
+CHART_DAILY_MAX_DAYS = 92
+CHART_WEEKLY_MAX_DAYS = 366
+
+
+def to_epoch_day(d: date) -> int:
+    """Converts date to number of days since 1970-01-01"""
+    return d.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_day(day: int) -> date:
+    """Converts number of days since 1970-01-01 to date"""
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def parse_epoch_day(date_str: str) -> int:
+    """Parses 'YYYY-MM-DD' string to epoch day"""
+    return to_epoch_day(date.fromisoformat(date_str))
+
+
+def format_epoch_day(day: int) -> str:
+    """Formats epoch day as 'YYYY-MM-DD' string"""
+    return from_epoch_day(day).strftime("%Y-%m-%d")
+
+
 def get_week_days() -> list[str]:
     """Returns list of dates for current week (starting from Monday)"""
     today = date.today()
@@ -50,16 +81,17 @@ def get_calendar_data(year: int, month: int) -> tuple[list[list[int]], str]:
     return cal, month_name
 
 
+def get_range_dates(start_date: date, end_date: date) -> list[date]:
+    """Returns list of dates from start_date to end_date inclusive"""
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
 def get_period_dates(period: str) -> list[date]:
     """Returns list of dates for specified period"""
     today = date.today()
 
-    if period == "7days":
-        start_date = today - timedelta(days=6)
-        return [start_date + timedelta(days=i) for i in range(7)]
-    elif period == "30days":
-        start_date = today - timedelta(days=29)
-        return [start_date + timedelta(days=i) for i in range(30)]
+    if period in ROLLING_PERIODS:
+        return get_range_dates(today - timedelta(days=ROLLING_PERIODS[period] - 1), today)
     elif period == "week":
         start_of_week = today - timedelta(days=today.weekday())
         return [start_of_week + timedelta(days=i) for i in range(7)]
@@ -81,6 +113,54 @@ def format_date_for_display(d: date) -> str:
     return f"{d.day} {MONTH_NAMES[d.month]}"
 
 
+def get_chart_buckets(start_date: date, end_date: date) -> tuple[str, list[tuple[str, date, date]]]:
+    """
+    Splits a report range into chart points: single days for short ranges,
+    Monday-based weeks up to a year and calendar months beyond, the first and
+    last clipped to the range. Returns (bucket, [(label, first_date, last_date)]).
+    """
+    span = (end_date - start_date).days + 1
+    if span <= CHART_DAILY_MAX_DAYS:
+        return "day", [
+            (format_date_for_display(d), d, d) for d in get_range_dates(start_date, end_date)
+        ]
+
+    buckets = []
+    first = start_date
+    while first <= end_date:
+        if span <= CHART_WEEKLY_MAX_DAYS:
+            bucket = "week"
+            label = format_date_for_display(first)
+            next_first = first + timedelta(days=7 - first.weekday())
+        else:
+            bucket = "month"
+            label = f"{MONTH_NAMES[first.month]} {first.year}"
+            next_first = (first.replace(day=1) + timedelta(days=32)).replace(day=1)
+        last = min(next_first - timedelta(days=1), end_date)
+        buckets.append((label, first, last))
+        first = next_first
+    return bucket, buckets
+
+
+def get_year_weeks(year: int) -> list[list[date | None]]:
+    """
+    Returns weeks (Monday to Sunday) covering the year, as in a year heatmap;
+    days outside the year are None
+    """
+    first = date(year, 1, 1)
+    monday = first - timedelta(days=first.weekday())
+    weeks = []
+    while monday.year <= year:
+        weeks.append(
+            [
+                day if day.year == year else None
+                for day in (monday + timedelta(days=i) for i in range(7))
+            ]
+        )
+        monday += timedelta(days=7)
+    return weeks
+
+
 def get_habit_color(habit_index: int) -> str:
     """Returns color for habit by index"""
     return HABIT_COLORS[habit_index % len(HABIT_COLORS)]
@@ -0,0 +1,134 @@
+"""
+Load benchmark: sync vs async database sessions
+Runs concurrent /reports requests against the in-process ASGI app once with
+DB_ASYNC=false and once with DB_ASYNC=true and prints throughput of both.
+
+Usage: python benchmarks/bench_async_db.py [--requests 200] [--concurrency 10] [--latency-ms 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sqlite3.dbapi2
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from benchmarks.seed import seed_history  # noqa: E402
+
+
+def install_statement_latency(seconds: float):
+    """
+    Simulates network round-trip of a database server on every statement.
+    The delay is added in the DB-API cursor, so it runs wherever the driver runs:
+    on the event loop thread for pysqlite, on the connection thread for aiosqlite.
+    """
+
+    class SlowCursor(sqlite3.Cursor):
+        def execute(self, *args, **kwargs):
+            time.sleep(seconds)
+            return super().execute(*args, **kwargs)
+
+    class SlowConnection(sqlite3.Connection):
+        def cursor(self, factory=SlowCursor):
+            return super().cursor(factory)
+
+    connect = sqlite3.connect
+
+    def slow_connect(*args, **kwargs):
+        return connect(*args, factory=SlowConnection, **kwargs)
+
+    # pysqlite resolves sqlite3.dbapi2.connect, aiosqlite resolves sqlite3.connect
+    sqlite3.connect = sqlite3.dbapi2.connect = slow_connect
+
+
+async def drive(requests: int, concurrency: int, users: int, latency_ms: float) -> float:
+    """Sends requests with given concurrency, returns requests per second"""
+    if latency_ms:
+        install_statement_latency(latency_ms / 1000)
+
+    import httpx
+
+    from app.database import dispose_engines
+    from app.main import app
+
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await client.get(f"/reports?user_id=bench_{i % users}&period=30days")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await dispose_engines()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--habits", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        rps = asyncio.run(drive(args.requests, args.concurrency, args.users, args.latency_ms))
+        print(f"{rps:.1f}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ["DATABASE_URL"] = database_url
+        from app.utils import to_epoch_day
+
+        today = to_epoch_day(date.today())
+        seed_history(
+            [f"bench_{u}" for u in range(args.users)],
+            args.habits,
+            lambda _u, _h: [today - i for i in range(0, args.days, 2)],
+            args.days,
+        )
+
+        results = {}
+        for mode in ("false", "true"):
+            env = {**os.environ, "DATABASE_URL": database_url, "DB_ASYNC": mode}
+            output = subprocess.run(
+                [sys.executable, __file__, "--worker", *sys.argv[1:]],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            results[mode] = float(output.stdout.strip().splitlines()[-1])
+
+    print(
+        f"/reports x{args.requests}, concurrency {args.concurrency}, "
+        f"{args.latency_ms} ms per statement"
+    )
+    print(f"  sync sessions:  {results['false']:8.1f} req/s")
+    print(f"  async sessions: {results['true']:8.1f} req/s")
+    print(f"  speedup:        {results['true'] / results['false']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
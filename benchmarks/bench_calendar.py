@@ -0,0 +1,159 @@
+"""
+Micro-benchmark: per-day completion counts of the monthly calendar
+Seeds a fresh SQLite database with one user, --habits habits and --days
+days of history (plus an archived habit whose completions must not count),
+then builds the calendar summary of the last full month three ways: the
+former dense habits x days dict summed in Python, a GROUP BY day query over
+completions, and the current read of the daily_rollup table. All must give
+the same summary. The per-day counts of the whole --days span (a year view)
+are read both from completions and from the rollup as well.
+
+Usage: python benchmarks/bench_calendar.py [--habits 50] [--days 365] [--requests 500]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from benchmarks.seed import seed_history  # noqa: E402
+
+USER_ID = "bench_user"
+
+
+def count_from_completions(db, user_id: str, start_day: int, end_day: int) -> dict[int, int]:
+    """Per-day counts with GROUP BY day over completions of non-archived habits"""
+    from sqlalchemy import false, func
+
+    from app.database import CompletionModel, HabitModel
+
+    rows = (
+        db.query(CompletionModel.day, func.count(CompletionModel.id))
+        .join(HabitModel, HabitModel.id == CompletionModel.habit_id)
+        .filter(
+            CompletionModel.user_id == user_id,
+            CompletionModel.day.between(start_day, end_day),
+            HabitModel.archived == false(),
+        )
+        .group_by(CompletionModel.day)
+        .all()
+    )
+    return dict(rows)
+
+
+def load_calendar_group_by(db, user_id: str, month_days: list[int]) -> dict:
+    """GROUP BY path: per-day counts counted from completions on every request"""
+    from app.database import get_all_habits
+    from app.services import summarize_day
+    from app.utils import format_epoch_day
+
+    habits = get_all_habits(db, user_id)
+    counts = count_from_completions(db, user_id, min(month_days), max(month_days))
+    day_completions = {
+        format_epoch_day(day): summarize_day(counts.get(day, 0), len(habits)) for day in month_days
+    }
+    return {"habits": habits, "day_completions": day_completions}
+
+
+def load_calendar_legacy(db, user_id: str, month_days: list[int]) -> dict:
+    """Former path: dense {(habit_id, day): bool} dict, then O(days x habits) sums"""
+    from app.database import get_all_habits
+    from app.services import get_completed_days, summarize_day
+    from app.utils import format_epoch_day
+
+    habits = get_all_habits(db, user_id)
+    habit_ids = [h["id"] for h in habits]
+    completion_set = set(
+        get_completed_days(db, user_id, habit_ids, min(month_days), max(month_days))
+    )
+    completions_map = {
+        (habit_id, day): (habit_id, day) in completion_set
+        for habit_id in habit_ids
+        for day in month_days
+    }
+
+    day_completions = {}
+    for day in month_days:
+        completed_count = sum(
+            1 for habit_id in habit_ids if completions_map.get((habit_id, day), False)
+        )
+        day_completions[format_epoch_day(day)] = summarize_day(completed_count, len(habits))
+    return {"habits": habits, "day_completions": day_completions}
+
+
+def measure(label: str, fn, args: tuple, requests: int) -> tuple[float, dict]:
+    """Returns mean milliseconds per call and the last result; a session per call, as in the app"""
+    from app.database import SessionLocal
+
+    for _ in range(min(requests, 20)):
+        with SessionLocal() as db:
+            fn(db, USER_ID, *args)
+    started = time.perf_counter()
+    for _ in range(requests):
+        with SessionLocal() as db:
+            result = fn(db, USER_ID, *args)
+    millis = (time.perf_counter() - started) / requests * 1000
+    print(f"  {label:<28} {millis:8.3f} ms/request")
+    return millis, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--habits", type=int, default=50)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ["HABIT_PURGE_INTERVAL"] = "0"
+
+        from app.services import get_daily_completion_counts, load_calendar
+        from app.utils import to_epoch_day
+
+        today = to_epoch_day(date.today())
+        # Two days of three, plus an archived habit whose completions must not count
+        seed_history(
+            [USER_ID],
+            args.habits + 1,
+            lambda _u, h: [today - i for i in range(args.days) if (i + h) % 3],
+            args.days,
+            archived=1,
+        )
+        last_day = date.today().replace(day=1) - timedelta(days=1)
+        month_days = list(range(to_epoch_day(last_day.replace(day=1)), to_epoch_day(last_day) + 1))
+
+        print(f"calendar of {len(month_days)} days, {args.habits} habits x{args.requests}")
+        results = [
+            measure(label, fn, (month_days,), args.requests)
+            for label, fn in (
+                ("dense dict + Python sums", load_calendar_legacy),
+                ("GROUP BY day", load_calendar_group_by),
+                ("daily_rollup", load_calendar),
+            )
+        ]
+        print(f"  daily_rollup is {results[0][0] / results[2][0]:.1f}x faster than dense dict")
+
+        today = to_epoch_day(date.today())
+        span = (today - args.days + 1, today)
+        print(f"per-day counts of {args.days} days")
+        year = [
+            measure(label, fn, span, args.requests)
+            for label, fn in (
+                ("GROUP BY day", count_from_completions),
+                ("daily_rollup", get_daily_completion_counts),
+            )
+        ]
+        print(f"  daily_rollup is {year[0][0] / year[1][0]:.1f}x faster")
+        if any(result != results[0][1] for _, result in results) or year[0][1] != year[1][1]:
+            sys.exit("results differ")
+
+
+if __name__ == "__main__":
+    main()
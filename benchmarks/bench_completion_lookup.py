@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: memory and time of the completion lookup behind the week view
+and reports, with no database. From the (habit_id, day) rows of --habits habits
+over --days days builds and reads back every pair two ways: the former dense
+{(habit_id, day): bool} dict of get_completions_batch, and one CompletionBitmap
+per habit as get_completion_bitmaps does. Reports the peak traced allocation
+and the mean time per request; both lookups must agree.
+
+Usage: python benchmarks/bench_completion_lookup.py [--habits 50] [--days 30] [--requests 2000]
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from app.bitmaps import CompletionBitmap  # noqa: E402
+
+START_DAY = 19_700
+
+
+def dense_lookup(rows, habit_ids: list[str], days: list[int]) -> list[list[bool]]:
+    """Former path: a dict entry for every habit x day pair, read back with .get()"""
+    completion_set = set(rows)
+    completions_map = {}
+    for habit_id in habit_ids:
+        for day in days:
+            completions_map[(habit_id, day)] = (habit_id, day) in completion_set
+    return [[completions_map.get((habit_id, day), False) for day in days] for habit_id in habit_ids]
+
+
+def bitmap_lookup(rows, habit_ids: list[str], days: list[int]) -> list[list[bool]]:
+    """Current path: completed days grouped per habit and packed into a bitmap"""
+    days_by_habit: dict[str, list[int]] = {habit_id: [] for habit_id in habit_ids}
+    for habit_id, day in rows:
+        days_by_habit[habit_id].append(day)
+    bitmaps = {
+        habit_id: CompletionBitmap.from_days(habit_days, origin=days[0])
+        for habit_id, habit_days in days_by_habit.items()
+    }
+    return [bitmaps[habit_id].completed_flags(days) for habit_id in habit_ids]
+
+
+def peak_allocation(fn, *args) -> int:
+    """Returns peak bytes allocated by one call, its result excluded"""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = fn(*args)
+    result_size = tracemalloc.get_traced_memory()[0] - baseline
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    del result
+    return peak - result_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--habits", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    habit_ids = [f"123456789_{h}" for h in range(1, args.habits + 1)]
+    days = list(range(START_DAY, START_DAY + args.days))
+    # Every habit completed on two days of three, in database row order
+    rows = [
+        (habit_id, day)
+        for habit_id in habit_ids
+        for i, day in enumerate(days)
+        if (i + len(habit_id)) % 3
+    ]
+    if dense_lookup(rows, habit_ids, days) != bitmap_lookup(rows, habit_ids, days):
+        sys.exit("lookups differ")
+
+    print(f"{args.habits} habits x {args.days} days, {len(rows)} completions")
+    results = {}
+    for name, fn in (("dense dict", dense_lookup), ("bitmap per habit", bitmap_lookup)):
+        peak = peak_allocation(fn, rows, habit_ids, days)
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            fn(rows, habit_ids, days)
+        micros = (time.perf_counter() - started) / args.requests * 1e6
+        results[name] = (peak, micros)
+        print(f"  {name:<18} {peak / 1024:8.1f} KiB peak  {micros:8.1f} us/request")
+
+    (dense_peak, dense_time), (bitmap_peak, bitmap_time) = results.values()
+    print(
+        f"  bitmaps allocate {dense_peak / bitmap_peak:.1f}x less and are "
+        f"{dense_time / bitmap_time:.1f}x faster"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Micro-benchmark: per-request overhead of POST /completions parsing
+Calls two minimal ASGI apps directly (no server, no database):
+the former handler with hand-made parse_qs parsing and per-request logging,
+and the current typed Form fields with the sampled tracer.
+
+Usage: python benchmarks/bench_completions_parsing.py [--requests 20000] [--log-level INFO]
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import sys
+import time
+import urllib.parse
+from http import HTTPStatus
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from fastapi import FastAPI, Form, HTTPException, Request  # noqa: E402
+from fastapi.responses import PlainTextResponse  # noqa: E402
+
+from app.tracing import SampledTracer  # noqa: E402
+
+BODY = b"habit_id=123456789_1&date=2024-05-17&context=week&user_id=123456789"
+
+
+def build_legacy_app() -> FastAPI:
+    """Former parsing path: middleware logging plus hand-made body parsing"""
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def log_completions_requests(request: Request, call_next):
+        if request.url.path == "/completions" and request.method == "POST":
+            logger = logging.getLogger("bench.legacy")
+            logger.info(
+                f"[DEBUG /completions] Request Content-Type: {request.headers.get('content-type', '')}"
+            )
+            logger.info(
+                f"[DEBUG /completions] Request Content-Length: {request.headers.get('content-length', '')}"
+            )
+            logger.info(f"[DEBUG /completions] Request URL: {request.url}")
+            logger.info(f"[DEBUG /completions] Request method: {request.method}")
+        return await call_next(request)
+
+    @app.post("/completions")
+    async def toggle_completion(request: Request):
+        logger = logging.getLogger("bench.legacy")
+        logger.info(f"[DEBUG /completions] Content-Type: {request.headers.get('content-type', '')}")
+        logger.info(
+            f"[DEBUG /completions] Content-Length: {request.headers.get('content-length', '')}"
+        )
+        logger.info(f"[DEBUG /completions] Request method: {request.method}")
+        logger.info(f"[DEBUG /completions] Request URL: {request.url}")
+        logger.info(f"[DEBUG /completions] All headers: {dict(request.headers)}")
+
+        body_str = (await request.body()).decode("utf-8")
+        logger.info(f"[DEBUG /completions] Request body (raw): '{body_str}'")
+        logger.info(f"[DEBUG /completions] Request body length: {len(body_str)}")
+
+        parsed_data = urllib.parse.parse_qs(body_str)
+        logger.info(f"[DEBUG /completions] Parsed body: {parsed_data}")
+        habit_id = parsed_data.get("habit_id", [None])[0]
+        date = parsed_data.get("date", [None])[0]
+        context = parsed_data.get("context", ["week"])[0]
+        user_id = parsed_data.get("user_id", [None])[0]
+        logger.info(
+            f"[DEBUG /completions] Parsed values: habit_id={habit_id}, date={date}, context={context}, user_id={user_id}"
+        )
+        if not habit_id or not date or not user_id:
+            raise HTTPException(status_code=422)
+        return PlainTextResponse(f"{habit_id} {date} {context} {user_id}")
+
+    return app
+
+
+def build_lean_app(tracer: SampledTracer) -> FastAPI:
+    """Current parsing path: typed form fields and sampled tracing"""
+    app = FastAPI()
+
+    @app.post("/completions")
+    async def toggle_completion(
+        habit_id: str = Form(...),
+        date_str: str = Form(..., alias="date"),
+        user_id: str = Form(...),
+        context: str = Form("week"),
+    ):
+        if tracer.sampled():
+            tracer.trace(
+                "POST /completions habit_id=%s date=%s context=%s user_id=%s",
+                habit_id,
+                date_str,
+                context,
+                user_id,
+            )
+        return PlainTextResponse(f"{habit_id} {date_str} {context} {user_id}")
+
+    return app
+
+
+async def call(app: FastAPI) -> int:
+    """Sends one form POST straight through the ASGI interface"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/completions",
+        "raw_path": b"/completions",
+        "query_string": b"",
+        "root_path": "",
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 50000),
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(BODY)).encode()),
+            (b"hx-request", b"true"),
+            (b"hx-target", b"this"),
+            (b"user-agent", b"Mozilla/5.0 (Linux; Android 14) TelegramWebApp"),
+        ],
+    }
+    messages = [{"type": "http.request", "body": BODY, "more_body": False}]
+    status = 0
+
+    async def receive():
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app: FastAPI, requests: int) -> float:
+    """Returns mean microseconds per request"""
+    for _ in range(min(requests, 500)):
+        assert await call(app) == HTTPStatus.OK
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call(app)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument(
+        "--log-level", default="INFO", help="level of the root logger, as configured in production"
+    )
+    args = parser.parse_args()
+
+    # Log records are formatted and written, but to memory so the terminal is not the bottleneck
+    logging.basicConfig(level=args.log_level, stream=io.StringIO(), force=True)
+
+    tracer = SampledTracer("bench.trace")
+    tracer.logger.handlers = logging.getLogger().handlers
+    tracer.logger.propagate = False
+
+    cases = [
+        ("legacy parse_qs + logging", build_legacy_app(), None),
+        ("typed Form, tracing off", build_lean_app(tracer), 0.0),
+        ("typed Form, 1% sampled", build_lean_app(tracer), 0.01),
+        ("typed Form, 100% sampled", build_lean_app(tracer), 1.0),
+    ]
+
+    print(f"POST /completions parsing x{args.requests}, root log level {args.log_level}")
+    baseline = None
+    for name, app, rate in cases:
+        if rate is not None:
+            tracer.set_rate(rate)
+        micros = asyncio.run(measure(app, args.requests))
+        baseline = baseline or micros
+        print(f"  {name:28s} {micros:8.1f} us/request  ({micros / baseline:5.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Load benchmark: latency, throughput and queries per request of the HTTP endpoints
+Seeds a fresh SQLite database with --users users, --habits habits each and
+--days days of history, then drives every endpoint through the in-process
+ASGI app with --concurrency concurrent clients. Reports p50/p95/p99 latency,
+requests per second and database statements per request; --output writes
+the results as JSON and --compare prints the change against an earlier file.
+
+The response cache is disabled unless --cache is given, so every request
+queries and renders.
+
+Usage: python benchmarks/bench_endpoints.py [--users 20] [--habits 10] [--days 365]
+       [--requests 500] [--concurrency 10] [--output results.json] [--compare base.json]
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from benchmarks.seed import seed_history  # noqa: E402
+
+ENDPOINTS = [
+    "/",
+    "/habits-list",
+    "/calendar",
+    "/heatmap",
+    "/reports?period=30days",
+    "/reports?period=365days",
+    "POST /completions",
+]
+
+# Statement counter of the request being served; asyncio tasks and
+# threadpool calls started by the request inherit it
+query_counter: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "query_counter", default=None
+)
+
+
+def install_query_counter():
+    @event.listens_for(Engine, "before_cursor_execute")
+    def count_statement(*_args):
+        counter = query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def build_request(endpoint: str, i: int, users: int, habits: int) -> tuple[str, str, dict]:
+    """Returns (method, url, form data) of request number i"""
+    user_id = f"bench_{i % users}"
+    if endpoint == "POST /completions":
+        week_start = date.today() - timedelta(days=date.today().weekday())
+        return (
+            "POST",
+            "/completions",
+            {
+                "habit_id": f"{user_id}_{i // users % habits + 1}",
+                "date": (week_start + timedelta(days=i % 7)).isoformat(),
+                "user_id": user_id,
+                "context": "week",
+            },
+        )
+    separator = "&" if "?" in endpoint else "?"
+    return "GET", f"{endpoint}{separator}user_id={user_id}", {}
+
+
+def summarize(latencies: list[float], queries: list[int], elapsed: float, errors: int) -> dict:
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p95_ms": round(cuts[94] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "queries_per_request": round(statistics.fmean(queries), 2),
+    }
+
+
+async def run_endpoint(client, endpoint: str, args) -> dict:
+    """Sends args.requests requests to endpoint from args.concurrency clients"""
+    next_request = iter(range(args.requests))
+    latencies: list[float] = []
+    queries: list[int] = []
+    errors = 0
+
+    async def send(i: int) -> tuple[float, int, bool]:
+        method, url, data = build_request(endpoint, i, args.users, args.habits)
+        counter = [0]
+        token = query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, data=data or None)
+        finally:
+            query_counter.reset(token)
+        return time.perf_counter() - started, counter[0], response.is_success
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            latency, count, ok = await send(i)
+            latencies.append(latency)
+            queries.append(count)
+            errors += not ok
+
+    # Warm up templates, compiled statement cache and connections
+    for i in range(min(args.warmup, args.requests)):
+        await send(args.requests + i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return summarize(latencies, queries, time.perf_counter() - started, errors)
+
+
+async def drive(args) -> dict:
+    import httpx
+
+    from app.database import dispose_engines
+    from app.main import app
+
+    install_query_counter()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for endpoint in args.endpoints:
+            results[endpoint] = await run_endpoint(client, endpoint, args)
+            print(format_result(endpoint, results[endpoint]), flush=True)
+    await dispose_engines()
+    return results
+
+
+def format_result(endpoint: str, result: dict) -> str:
+    line = (
+        f"  {endpoint:<24} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+        f"p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+        f"{result['queries_per_request']:5.1f} queries/req"
+    )
+    if result["errors"]:
+        line += f"  {result['errors']} errors"
+    return line
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results: dict, baseline_file: str):
+    baseline = json.loads(Path(baseline_file).read_text())
+    print(f"\nchange against {baseline_file} ({baseline.get('commit') or 'unknown commit'}):")
+    for endpoint, result in results.items():
+        before = baseline["results"].get(endpoint)
+        if before is None:
+            continue
+        print(
+            f"  {endpoint:<24} rps {(result['rps'] / before['rps'] - 1) * 100:+6.1f}%  "
+            f"p50 {(result['p50_ms'] / before['p50_ms'] - 1) * 100:+6.1f}%  "
+            f"p99 {(result['p99_ms'] / before['p99_ms'] - 1) * 100:+6.1f}%  "
+            f"queries {result['queries_per_request'] - before['queries_per_request']:+.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--habits", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--requests", type=int, default=500, help="per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        # Requests carry ?user_id=, as in development; .env must not enable Telegram auth
+        os.environ["TELEGRAM_BOT_TOKEN"] = ""
+        os.environ["HABIT_PURGE_INTERVAL"] = "0"
+        if not args.cache:
+            os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+
+        started = time.perf_counter()
+        from app.utils import to_epoch_day
+
+        today = to_epoch_day(date.today())
+        seed_history(
+            [f"bench_{u}" for u in range(args.users)],
+            args.habits,
+            lambda u, h: [today - i for i in range((u + h) % 2, args.days, 2)],
+            args.days,
+        )
+        print(
+            f"seeded {args.users} users x {args.habits} habits x {args.days} days "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        print(f"{args.requests} requests per endpoint, concurrency {args.concurrency}")
+        results = asyncio.run(drive(args))
+
+    report = {
+        "commit": get_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users,
+            "habits": args.habits,
+            "days": args.days,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+            "db_async": os.getenv("DB_ASYNC", "false"),
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"results written to {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+    if any(result["errors"] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: fan-out of /events deltas to many open streams with slow consumers
+Subscribes --streams streams of one user to the event broker, --slow of which
+never read, and publishes --events deltas. Reports publish throughput and
+checks that every reading stream got every delta while each slow stream holds
+at most EVENTS_QUEUE_SIZE entries and starts with a resync event.
+
+Usage: python benchmarks/bench_events.py [--streams 200] [--slow 20] [--events 2000]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from app.events import RESYNC_EVENT, EventBroker  # noqa: E402
+
+USER_ID = "bench_user"
+DELTA = '<form id="completion-bench_user_1-2024-01-01" hx-swap-oob="true">' + "x" * 400 + "</form>"
+
+
+async def run(args) -> bool:
+    broker = EventBroker(args.queue_size)
+    readers = [broker.subscribe(USER_ID, f"reader-{i}") for i in range(args.streams - args.slow)]
+    slow = [broker.subscribe(USER_ID, f"slow-{i}") for i in range(args.slow)]
+    received = [0] * len(readers)
+
+    async def read(i: int):
+        queue = readers[i].queue
+        while True:
+            event, _data = await queue.get()
+            if event == "stop":
+                return
+            received[i] += 1
+
+    tasks = [asyncio.create_task(read(i)) for i in range(len(readers))]
+    started = time.perf_counter()
+    for i in range(args.events):
+        broker.publish(USER_ID, "delta", DELTA)
+        if i % (args.queue_size // 2) == 0:
+            # Let the readers drain, as the event loop would between requests
+            await asyncio.sleep(0)
+    publish_seconds = time.perf_counter() - started
+    for reader in readers:
+        reader.put("stop", "")
+    await asyncio.gather(*tasks)
+
+    deliveries = args.events * args.streams
+    print(f"{args.streams} streams ({args.slow} slow), {args.events} events")
+    print(
+        f"  publish {args.events / publish_seconds:10.0f} events/s  "
+        f"{deliveries / publish_seconds:10.0f} deliveries/s"
+    )
+    complete = all(count == args.events for count in received)
+    bounded = all(s.queue.qsize() <= args.queue_size for s in slow)
+    resynced = all(s.queue.get_nowait()[0] == RESYNC_EVENT for s in slow)
+    print(f"  readers got every event: {complete}")
+    print(
+        f"  slow queues bounded at {args.queue_size}: {bounded}, start with resync: {resynced}, "
+        f"dropped {sum(s.dropped for s in slow)}"
+    )
+    return complete and bounded and resynced
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--slow", type=int, default=20)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--queue-size", type=int, default=32)
+    args = parser.parse_args()
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Memory check: streaming export of a long completion history
+Seeds one user with --rows completions (1M by default), downloads GET /export
+through the in-process ASGI app in a fresh process and compares the peak growth
+of its heap (sampled per chunk) with --budget-mb. Exits with status 1 over budget.
+
+Usage: python benchmarks/bench_export_memory.py [--rows 1000000] [--format csv] [--budget-mb 32]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from http import HTTPStatus
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from benchmarks.seed import seed_history  # noqa: E402
+
+USER_ID = "export_bench"
+HABITS = 50
+
+
+def anon_rss_mb() -> float:
+    """
+    Returns resident anonymous memory (heap) of the process.
+    Total RSS would also count SQLite's memory-mapped database pages,
+    which are file-backed and grow with the size of the database file.
+    """
+    with Path("/proc/self/status").open() as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    # Not Linux: fall back to peak RSS (KiB on Linux, bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20
+
+
+async def get(app, query: str, on_body) -> int:
+    """
+    Sends GET /export straight through the ASGI interface and hands every
+    body chunk to on_body; an HTTP client would buffer the whole body
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/export",
+        "raw_path": b"/export",
+        "query_string": query.encode(),
+        "root_path": "",
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 50000),
+        "headers": [(b"host", b"bench")],
+    }
+    status = 0
+
+    async def receive():
+        # Only asked for again when the client disconnects; keep the stream open
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            on_body(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status
+
+
+async def download(export_format: str) -> tuple[int, int, float, float]:
+    """Streams the export and discards it; returns (lines, bytes, seconds, peak RSS growth MB)"""
+    from app.database import dispose_engines
+    from app.main import app
+
+    # Warm up imports and the connection pool before measuring
+    await get(app, f"user_id=nobody&format={export_format}", lambda _chunk: None)
+    baseline = anon_rss_mb()
+
+    totals = {"lines": 0, "bytes": 0, "peak": baseline}
+
+    def on_body(chunk: bytes):
+        totals["lines"] += chunk.count(b"\n")
+        totals["bytes"] += len(chunk)
+        totals["peak"] = max(totals["peak"], anon_rss_mb())
+
+    started = time.perf_counter()
+    status = await get(app, f"user_id={USER_ID}&format={export_format}", on_body)
+    elapsed = time.perf_counter() - started
+    if status != HTTPStatus.OK:
+        sys.exit(f"GET /export returned {status}")
+
+    await dispose_engines()
+    return totals["lines"], totals["bytes"], elapsed, totals["peak"] - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--budget-mb", type=float, default=32.0)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        lines, size, elapsed, growth = asyncio.run(download(args.format))
+        print(lines, size, elapsed, growth)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{Path(tmp) / 'export.db'}"
+        started = time.perf_counter()
+        os.environ["DATABASE_URL"] = database_url
+        # HABITS habits sharing --rows daily completions
+        days_per_habit = -(-args.rows // HABITS)
+        seed_history(
+            [USER_ID],
+            HABITS,
+            lambda _u, h: range(min(days_per_habit, args.rows - (h - 1) * days_per_habit)),
+        )
+        print(f"seeded {args.rows} completions in {time.perf_counter() - started:.1f}s")
+
+        env = {**os.environ, "DATABASE_URL": database_url, "RESPONSE_CACHE_BACKEND": "memory"}
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", *sys.argv[1:]],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        lines, size, elapsed, growth = output.stdout.split()
+
+    lines, size, elapsed, growth = int(lines), int(size), float(elapsed), float(growth)
+    print(f"/export?format={args.format}: {lines} lines, {size / 2**20:.1f} MiB in {elapsed:.1f}s")
+    print(f"  throughput:        {lines / elapsed:10.0f} rows/s")
+    print(f"  peak heap growth:  {growth:10.1f} MB (budget {args.budget_mb} MB)")
+    if growth > args.budget_mb:
+        print("  over budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
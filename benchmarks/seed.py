@@ -0,0 +1,53 @@
+"""
+Database seeding shared by the benchmarks
+app reads its settings at import time, so it is imported on the first call:
+set DATABASE_URL and the rest of the environment before seeding.
+"""
+
+from collections.abc import Callable, Iterable
+from datetime import datetime, timedelta
+
+
+def seed_history(
+    user_ids: list[str],
+    habits: int,
+    completed_days: Callable[[int, int], Iterable[int]],
+    history_days: int = 0,
+    archived: int = 0,
+):
+    """
+    Fills the database with `habits` habits {user_id}_{n} per user, created
+    history_days ago, the last `archived` of them archived.
+    completed_days(user_index, habit_number) gives the epoch days each habit
+    was completed on. Statistics and the daily rollup are built as the app
+    keeps them.
+    """
+    from app.database import CompletionModel, HabitModel, SessionLocal
+    from app.services import rebuild_daily_rollup, rebuild_habit_stats
+
+    created_at = datetime.now() - timedelta(days=history_days)
+    with SessionLocal() as db:
+        for u, user_id in enumerate(user_ids):
+            for h in range(1, habits + 1):
+                habit_id = f"{user_id}_{h}"
+                db.add(
+                    HabitModel(
+                        id=habit_id,
+                        user_id=user_id,
+                        name=f"Habit {h}",
+                        color="#3b82f6",
+                        created_at=created_at,
+                        archived=h > habits - archived,
+                    )
+                )
+                # Completions reference the habit by foreign key in cascade mode
+                db.flush()
+                rows = [
+                    {"user_id": user_id, "habit_id": habit_id, "day": day}
+                    for day in completed_days(u, h)
+                ]
+                if rows:
+                    db.execute(CompletionModel.__table__.insert(), rows)
+                rebuild_habit_stats(db, user_id, habit_id)
+        db.commit()
+        rebuild_daily_rollup(db)
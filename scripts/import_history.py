@@ -0,0 +1,65 @@
+"""
+Bulk import of habit history for one user from CSV or NDJSON
+Accepts GET /export output and exports of other trackers with habit_name and date columns.
+Safe to run again: existing habits are matched by name and duplicate completions are skipped.
+
+Usage: python scripts/import_history.py --user-id 123456789 history.csv [--format csv]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.cache import response_cache
+from app.database import SessionLocal
+from app.importer import IMPORT_CHUNK_SIZE, IMPORT_PARSERS, import_history
+
+
+def print_progress(stats: dict):
+    print(
+        f"  {stats['rows']:>10} rows read, {stats['habits_created']} habits created, "
+        f"{stats['rows_per_second']:,.0f} rows/s",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import habit history for one user")
+    parser.add_argument("file", help="CSV or NDJSON file, - for stdin")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--format", choices=sorted(IMPORT_PARSERS), help="default: from extension")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    import_format = args.format or (
+        "ndjson" if args.file.endswith((".ndjson", ".jsonl")) else "csv"
+    )
+    print(f"Importing {args.file} ({import_format}) for user {args.user_id}...")
+
+    with sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="") as f:
+        records = IMPORT_PARSERS[import_format](f)
+        with SessionLocal() as db:
+            try:
+                summary = import_history(
+                    db, args.user_id, records, chunk_size=args.chunk_size, progress=print_progress
+                )
+            except ValueError as e:
+                # Chunks before the bad line are committed; rerunning a fixed file skips them
+                db.rollback()
+                sys.exit(f"✗ Invalid {import_format} file: {e}")
+    response_cache.invalidate(args.user_id)
+
+    print(
+        f"✓ {summary['rows']} rows in {summary['elapsed']:.1f}s "
+        f"({summary['rows_per_second']:,} rows/s): "
+        f"{summary['habits_created']} habits created, "
+        f"{summary['completions_inserted']} completions inserted, "
+        f"{summary['rows'] - summary['completions_inserted'] - summary['skipped']} duplicates or habit rows, "
+        f"{summary['skipped']} rows with invalid dates skipped"
+    )
+
+
+if __name__ == "__main__":
+    main()
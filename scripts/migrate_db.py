@@ -1,5 +1,6 @@
 """
-Database migration script: adding user_id field
+Database migration script: adding user_id field, completions uniqueness,
+integer epoch-day storage, habit archiving and the daily completion rollup
 Run this script once to update existing database
 """
 
@@ -11,6 +12,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy import text
 
 from app.database import SessionLocal
+from app.services import rebuild_daily_rollup
 
 
 def migrate_database():
@@ -49,6 +51,123 @@ def migrate_database():
         else:
             print("✓ user_id field already exists in completions table")
 
+        # Check if composite unique index exists on completions table
+        result = db.execute(text("PRAGMA index_list(completions)"))
+        indexes = [row[1] for row in result]
+
+        if "date" in columns and "uq_completions_user_habit_date" not in indexes:
+            print("Removing duplicate completions...")
+            removed = db.execute(
+                text(
+                    "DELETE FROM completions WHERE id NOT IN ("
+                    "SELECT MIN(id) FROM completions GROUP BY user_id, habit_id, date)"
+                )
+            ).rowcount
+            print(f"✓ {removed} duplicate completions removed")
+
+            print("Adding unique (user_id, habit_id, date) index to completions table...")
+            db.execute(
+                text(
+                    "CREATE UNIQUE INDEX uq_completions_user_habit_date "
+                    "ON completions(user_id, habit_id, date)"
+                )
+            )
+            # Single-column indexes are covered by the composite one
+            for index_name in (
+                "ix_completions_user_id",
+                "ix_completions_habit_id",
+                "ix_completions_date",
+                "idx_completions_user_id",
+            ):
+                db.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+            db.commit()
+            print("✓ Unique index added to completions table")
+        else:
+            print("✓ Unique index already exists on completions table")
+
+        # Check if completions table stores dates as epoch days
+        if "day" not in columns:
+            print("Converting completions dates to integer epoch days...")
+            db.execute(
+                text(
+                    "CREATE TABLE completions_new ("
+                    "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+                    "user_id VARCHAR NOT NULL, "
+                    "habit_id VARCHAR NOT NULL, "
+                    "day INTEGER NOT NULL)"
+                )
+            )
+            db.execute(
+                text(
+                    "CREATE UNIQUE INDEX uq_completions_user_habit_day "
+                    "ON completions_new(user_id, habit_id, day)"
+                )
+            )
+            # Rows whose date SQLite can't parse are kept aside instead of being dropped
+            db.execute(
+                text(
+                    "CREATE TABLE IF NOT EXISTS completions_invalid_dates ("
+                    "id INTEGER, user_id VARCHAR, habit_id VARCHAR, date VARCHAR)"
+                )
+            )
+            quarantined = db.execute(
+                text(
+                    "INSERT INTO completions_invalid_dates (id, user_id, habit_id, date) "
+                    "SELECT id, user_id, habit_id, date FROM completions "
+                    "WHERE julianday(date) IS NULL"
+                )
+            ).rowcount
+            total = db.execute(text("SELECT COUNT(*) FROM completions")).scalar()
+            converted = db.execute(
+                text(
+                    "INSERT OR IGNORE INTO completions_new (id, user_id, habit_id, day) "
+                    "SELECT id, user_id, habit_id, "
+                    "CAST(julianday(date) - julianday('1970-01-01') AS INTEGER) "
+                    "FROM completions WHERE julianday(date) IS NOT NULL"
+                )
+            ).rowcount
+            db.execute(text("DROP TABLE completions"))
+            db.execute(text("ALTER TABLE completions_new RENAME TO completions"))
+            db.execute(text("CREATE INDEX ix_completions_id ON completions(id)"))
+            db.commit()
+            print(f"✓ completions table converted to epoch days ({converted} rows)")
+            if quarantined:
+                print(
+                    f"⚠ {quarantined} completions with unparseable dates "
+                    "copied to completions_invalid_dates"
+                )
+            # Different spellings of one date (e.g. with a time part) land on the same day
+            merged = total - quarantined - converted
+            if merged:
+                print(f"⚠ {merged} completions merged into a completion of the same day")
+        else:
+            print("✓ completions table already uses epoch days")
+
+        # Soft delete of habits: archived flag filtered by every habits query
+        result = db.execute(text("PRAGMA table_info(habits)"))
+        columns = [row[1] for row in result]
+
+        if "archived" not in columns:
+            print("Adding archived fields to habits table...")
+            db.execute(text("ALTER TABLE habits ADD COLUMN archived BOOLEAN NOT NULL DEFAULT 0"))
+            db.execute(text("ALTER TABLE habits ADD COLUMN archived_at DATETIME"))
+            db.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_habits_user_archived "
+                    "ON habits(user_id, archived)"
+                )
+            )
+            db.commit()
+            print("✓ archived fields added to habits table")
+        else:
+            print("✓ archived fields already exist in habits table")
+
+        # Per-day completed counts: the app creates the table empty on startup and
+        # keeps it updated from then on, so rows present don't mean it was ever built
+        print("Rebuilding daily_rollup from completions...")
+        written = rebuild_daily_rollup(db)
+        print(f"✓ daily_rollup rebuilt with {written} rows")
+
         print("\nMigration completed successfully!")
         print("WARNING: All existing data has been linked to user_id='default_user'")
         print("For production, it's recommended to delete old DB and create new one")
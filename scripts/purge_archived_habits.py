@@ -0,0 +1,31 @@
+"""
+Purges completions and statistics of archived (deleted) habits
+The web app does this periodically (HABIT_PURGE_INTERVAL); run this script
+instead from cron when the in-process job is disabled.
+
+Usage: python scripts/purge_archived_habits.py [--batch-size 1000]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.jobs import HABIT_PURGE_BATCH_SIZE
+from app.services import purge_archived_habits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge archived habits")
+    parser.add_argument("--batch-size", type=int, default=HABIT_PURGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        purged = purge_archived_habits(db, args.batch_size)
+    print(f"✓ Purged {purged['habits']} archived habits with {purged['completions']} completions")
+
+
+if __name__ == "__main__":
+    main()
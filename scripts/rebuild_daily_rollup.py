@@ -0,0 +1,43 @@
+"""
+Rebuilds or checks the daily_rollup table (per-user completed counts per day)
+The web app keeps it up to date on every write; rebuild it once for a database
+created before the table existed, and run --check to verify it against the
+completions. --check exits with status 1 when any day differs.
+
+Usage: python scripts/rebuild_daily_rollup.py [--user-id 123456789] [--check]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.services import check_daily_rollup, rebuild_daily_rollup
+from app.utils import format_epoch_day
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or check the daily completion rollup")
+    parser.add_argument("--user-id", help="only this user, default: everyone")
+    parser.add_argument("--check", action="store_true", help="compare instead of rebuilding")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if not args.check:
+            written = rebuild_daily_rollup(db, args.user_id)
+            print(f"✓ daily_rollup rebuilt: {written} rows")
+            return
+
+        mismatches = check_daily_rollup(db, args.user_id)
+    for user_id, day, stored, actual in mismatches[:50]:
+        print(f"  {user_id} {format_epoch_day(day)}: stored {stored}, counted {actual}")
+    if mismatches:
+        print(f"✗ {len(mismatches)} days differ, run without --check to rebuild")
+        sys.exit(1)
+    print("✓ daily_rollup matches completions")
+
+
+if __name__ == "__main__":
+    main()
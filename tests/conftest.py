@@ -0,0 +1,109 @@
+"""
+Shared fixtures. The app reads its settings at import time, so the
+environment is pointed at a throwaway SQLite database before app is imported.
+"""
+
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="habits-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(TEST_DIR) / 'test.db'}"
+# Requests carry ?user_id=, as in development; .env must not enable Telegram auth
+os.environ["TELEGRAM_BOT_TOKEN"] = ""
+os.environ["HABIT_PURGE_INTERVAL"] = "0"
+os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import database  # noqa: E402
+from app.database import CompletionModel, HabitModel, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import rebuild_daily_rollup, rebuild_habit_stats  # noqa: E402
+from app.utils import to_epoch_day  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def user_id() -> str:
+    """Fresh user per test, so tests share the database without seeing each other's rows"""
+    return f"test_{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def make_habits(db):
+    """Creates habits of a user, each completed on every other day of the last `days` days"""
+
+    def make(user_id: str, count: int, days: int = 30) -> list[str]:
+        today = to_epoch_day(date.today())
+        habit_ids = []
+        for n in range(1, count + 1):
+            habit_id = f"{user_id}_{n}"
+            db.add(
+                HabitModel(
+                    id=habit_id,
+                    user_id=user_id,
+                    name=f"Habit {n}",
+                    color="#3b82f6",
+                    created_at=datetime.now() - timedelta(days=days),
+                )
+            )
+            # Completions reference the habit by foreign key in cascade mode
+            db.flush()
+            rows = [
+                {"user_id": user_id, "habit_id": habit_id, "day": today - i}
+                for i in range(n % 2, days, 2)
+            ]
+            if rows:
+                db.execute(CompletionModel.__table__.insert(), rows)
+            rebuild_habit_stats(db, user_id, habit_id)
+            habit_ids.append(habit_id)
+        db.commit()
+        rebuild_daily_rollup(db, user_id)
+        return habit_ids
+
+    return make
+
+
+@pytest.fixture
+def count_queries():
+    """Counts SQL statements sent while the returned context is active"""
+    # With DB_ASYNC=true requests query through the async engine's sync core
+    engines = [engine]
+    if database.DB_ASYNC:
+        engines.append(database.async_engine.sync_engine)
+
+    class QueryCounter:
+        def __init__(self):
+            self.count = 0
+
+        def __enter__(self):
+            self.count = 0
+            for counted in engines:
+                event.listen(counted, "before_cursor_execute", self._count)
+            return self
+
+        def __exit__(self, *_exc):
+            for counted in engines:
+                event.remove(counted, "before_cursor_execute", self._count)
+
+        def _count(self, *_args):
+            self.count += 1
+
+    return QueryCounter()
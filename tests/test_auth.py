@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+
+import pytest
+from fastapi import Request
+
+from app.telegram_auth import (
+    EVENTS_TOKEN_SCOPE,
+    SESSION_COOKIE_NAME,
+    get_events_user_id_dependency,
+    sign_session,
+    validate_telegram_init_data,
+    verify_session,
+)
+
+BOT_TOKEN = "123456:test-token"
+
+
+def make_init_data(telegram_user_id: int, auth_date: int | None = None) -> str:
+    """Builds initData signed like Telegram does for the WebApp of BOT_TOKEN"""
+    fields = {
+        "auth_date": str(auth_date or int(time.time())),
+        "user": json.dumps({"id": telegram_user_id, "first_name": "Test"}),
+    }
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+
+@pytest.fixture
+def bot_token(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", BOT_TOKEN)
+    monkeypatch.setenv("ALLOW_DEFAULT_USER", "false")
+    return BOT_TOKEN
+
+
+@pytest.fixture
+def telegram_user_id() -> int:
+    return time.time_ns() % 10**9
+
+
+def test_init_data_validation():
+    init_data = make_init_data(42)
+
+    assert validate_telegram_init_data(init_data, BOT_TOKEN)["user"]["id"] == 42
+    assert validate_telegram_init_data(init_data, "other:token") is None
+    assert validate_telegram_init_data(make_init_data(42, auth_date=1), BOT_TOKEN) is None
+
+
+def test_scoped_token_is_not_a_session():
+    events_token = sign_session("42", BOT_TOKEN, scope=EVENTS_TOKEN_SCOPE)
+    session = sign_session("42", BOT_TOKEN)
+
+    assert verify_session(events_token, BOT_TOKEN, scope=EVENTS_TOKEN_SCOPE) == "42"
+    assert verify_session(events_token, BOT_TOKEN) is None
+    assert verify_session(session, BOT_TOKEN, scope=EVENTS_TOKEN_SCOPE) is None
+
+
+def test_session_cookie_authenticates_reads(client, bot_token, telegram_user_id):
+    client.cookies.set(SESSION_COOKIE_NAME, sign_session(str(telegram_user_id), bot_token))
+
+    assert client.get("/habits-list").status_code == 200
+
+
+def test_session_cookie_alone_cannot_write(client, bot_token, telegram_user_id):
+    """A cross-site form carries the SameSite=None cookie but can't set the initData header"""
+    client.cookies.set(SESSION_COOKIE_NAME, sign_session(str(telegram_user_id), bot_token))
+
+    response = client.post("/habits", data={"name": "Run"})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.usefixtures("bot_token")
+def test_init_data_header_authenticates_writes(client, telegram_user_id):
+    headers = {"X-Telegram-Init-Data": make_init_data(telegram_user_id)}
+
+    response = client.post("/habits", data={"name": "Run"}, headers=headers)
+
+    assert response.status_code == 200
+    assert SESSION_COOKIE_NAME in response.cookies
+
+
+def test_page_renders_events_token(client, bot_token, telegram_user_id):
+    headers = {"X-Telegram-Init-Data": make_init_data(telegram_user_id)}
+
+    response = client.get("/", headers=headers)
+
+    token = response.text.split("&token=", 1)[1].split('"', 1)[0]
+    assert verify_session(token, bot_token, scope=EVENTS_TOKEN_SCOPE) == str(telegram_user_id)
+
+
+@pytest.mark.usefixtures("bot_token")
+def test_events_rejects_invalid_token(client):
+    response = client.get("/events?token=1.9999999999.forged")
+
+    assert response.status_code == 401
+
+
+def test_events_token_identifies_user_without_cookie(bot_token):
+    token = sign_session("42", bot_token, scope=EVENTS_TOKEN_SCOPE)
+    request = Request({"type": "http", "method": "GET", "headers": [], "query_string": b""})
+
+    assert get_events_user_id_dependency(request, None, token) == "42"
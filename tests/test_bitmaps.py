@@ -0,0 +1,134 @@
+import gc
+import random
+import tracemalloc
+from datetime import date, timedelta
+
+import pytest
+
+from app.bitmaps import CompletionBitmap
+from app.services import enrich_habits_with_completions, get_completed_days
+from app.utils import parse_epoch_day
+
+# 2023-12-09, a realistic epoch day
+DAY = 19_700
+
+
+def test_flags_and_counts_at_epoch_day_offsets():
+    bitmap = CompletionBitmap.from_days([DAY, DAY + 2, DAY + 3], origin=DAY)
+
+    assert bitmap.completed_flags(range(DAY - 1, DAY + 5)) == [
+        False,
+        True,
+        False,
+        True,
+        True,
+        False,
+    ]
+    assert len(bitmap) == 3
+    assert bitmap.count(DAY, DAY + 6) == 3
+    assert bitmap.completion_rate(DAY, DAY + 5) == 50
+
+
+def test_days_before_origin_are_ignored():
+    bitmap = CompletionBitmap.from_days([DAY - 3, DAY, DAY + 1], origin=DAY)
+
+    assert len(bitmap) == 2
+    assert bitmap.completed_flags([DAY - 3]) == [False]
+    # A range starting before origin reads the missing days as not completed
+    assert bitmap.count(DAY - 10, DAY + 1) == 2
+    assert bitmap.window(DAY - 2, DAY + 1) == 0b1100
+
+
+def test_days_before_1970():
+    days = [-5, -3, -2, -1, 0, 2]
+    bitmap = CompletionBitmap.from_days(days)
+
+    assert bitmap.origin == -5
+    assert bitmap.completed_flags(range(-6, 4)) == [day in days for day in range(-6, 4)]
+    assert bitmap.longest_streak(-5, 2) == 4
+    assert bitmap.current_streak(-5, 0) == 4
+    assert bitmap.count(-5, -1) == 4
+
+
+def test_sparse_days_span_years():
+    days = [DAY - 20_000, DAY - 3_000, DAY, DAY + 1]
+    bitmap = CompletionBitmap.from_days(days)
+
+    assert bitmap.origin == DAY - 20_000
+    assert len(bitmap) == 4
+    assert bitmap.completed_flags(days) == [True] * 4
+    assert bitmap.count(DAY - 2_999, DAY - 1) == 0
+    assert bitmap.longest_streak(bitmap.origin, DAY + 1) == 2
+    assert bitmap.current_streak(bitmap.origin, DAY + 1) == 2
+
+
+@pytest.mark.parametrize("span", [CompletionBitmap.SMALL_SPAN - 1, CompletionBitmap.SMALL_SPAN * 8])
+def test_small_and_large_spans_build_the_same_bits(span):
+    days = [*random.Random(span).sample(range(DAY, DAY + span + 1), span // 3), DAY + span]
+    bitmap = CompletionBitmap.from_days(days, origin=DAY)
+
+    assert bitmap.bits == sum(1 << (day - DAY) for day in set(days))
+
+
+def test_streaks():
+    # Completed on DAY..DAY+2, DAY+4..DAY+7, DAY+9
+    bitmap = CompletionBitmap.from_days([DAY, DAY + 1, DAY + 2, *range(DAY + 4, DAY + 8), DAY + 9])
+
+    assert bitmap.longest_streak(DAY, DAY + 9) == 4
+    assert bitmap.longest_streak(DAY, DAY + 5) == 3
+    assert bitmap.current_streak(DAY, DAY + 9) == 1
+    assert bitmap.current_streak(DAY, DAY + 8) == 0
+    assert bitmap.current_streak(DAY + 5, DAY + 7) == 3
+
+
+def test_bucket_counts():
+    bitmap = CompletionBitmap.from_days(range(DAY, DAY + 10, 2), origin=DAY)
+
+    assert bitmap.bucket_counts([(DAY - 7, DAY - 1), (DAY, DAY + 6), (DAY + 7, DAY + 13)]) == [
+        0,
+        4,
+        1,
+    ]
+
+
+def test_empty_and_reversed_ranges():
+    bitmap = CompletionBitmap.from_days([])
+
+    assert len(bitmap) == 0
+    assert bitmap.completed_flags([DAY]) == [False]
+    assert CompletionBitmap.from_days([DAY]).count(DAY + 1, DAY) == 0
+    assert CompletionBitmap.from_days([DAY]).completion_rate(DAY + 1, DAY) == 0
+    assert CompletionBitmap.from_days([DAY]).current_streak(DAY + 1, DAY) == 0
+
+
+def peak_allocation(fn, *args) -> tuple[int, int]:
+    """Returns (peak, retained) bytes allocated by one call"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, retained
+
+
+@pytest.mark.parametrize("days_count", [7, 30, 365])
+def test_week_and_report_lookup_allocates_little_beyond_rows_and_result(
+    db, make_habits, user_id, days_count
+):
+    habit_ids = make_habits(user_id, 50, days=365)
+    habits = [{"id": habit_id} for habit_id in habit_ids]
+    today = date.today()
+    dates = [(today - timedelta(days=i)).isoformat() for i in reversed(range(days_count))]
+    start_day, end_day = parse_epoch_day(dates[0]), parse_epoch_day(dates[-1])
+    # Warms SQLAlchemy's statement cache, which would count as allocated otherwise
+    enrich_habits_with_completions(db, user_id, habits, dates)
+
+    fetch_peak, _ = peak_allocation(get_completed_days, db, user_id, habit_ids, start_day, end_day)
+    peak, retained = peak_allocation(enrich_habits_with_completions, db, user_id, habits, dates)
+
+    # Beyond the fetched rows and the result itself, the bitmaps take a few KiB.
+    # A {(habit_id, day): bool} map of every pair, as before, took 55-260% of the result.
+    assert peak - fetch_peak < retained / 4
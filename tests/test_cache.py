@@ -0,0 +1,68 @@
+from datetime import date
+
+from sqlalchemy import event
+
+from app.database import engine, get_user_data_version
+from app.services import rebuild_daily_rollup, toggle_habit_completion
+from app.utils import to_epoch_day
+
+
+def test_write_bumps_version_in_its_own_transaction(db, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=0)
+    before = get_user_data_version(db, user_id)
+    commits = []
+
+    def count_commit(_conn):
+        commits.append(1)
+
+    event.listen(engine, "commit", count_commit)
+    try:
+        toggle_habit_completion(db, user_id, habit_id, to_epoch_day(date.today()))
+    finally:
+        event.remove(engine, "commit", count_commit)
+
+    # Data and version become visible together, with no window between them
+    assert len(commits) == 1
+    assert get_user_data_version(db, user_id) == before + 1
+
+
+def test_etag_changes_after_write(client, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1)
+    url = f"/calendar?user_id={user_id}"
+
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    form = {"habit_id": habit_id, "date": date.today().isoformat(), "user_id": user_id}
+    client.post("/completions", data=form)
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_not_modified_reads_only_the_data_version(client, make_habits, count_queries, user_id):
+    make_habits(user_id, 5)
+    url = f"/reports?user_id={user_id}&period=30days"
+    etag = client.get(url).headers["etag"]
+
+    with count_queries as counter:
+        response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert counter.count == 1
+
+
+def test_rollup_rebuild_bumps_version(db, make_habits, user_id):
+    make_habits(user_id, 1)
+    other_user_id = f"{user_id}_other"
+    make_habits(other_user_id, 1)
+    before = [get_user_data_version(db, user) for user in (user_id, other_user_id)]
+
+    rebuild_daily_rollup(db, user_id)
+    assert get_user_data_version(db, user_id) == before[0] + 1
+    assert get_user_data_version(db, other_user_id) == before[1]
+
+    rebuild_daily_rollup(db)
+    assert get_user_data_version(db, user_id) == before[0] + 2
+    assert get_user_data_version(db, other_user_id) == before[1] + 1
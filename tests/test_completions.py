@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import delete, event, update
+
+from app.database import DailyRollupModel, HabitStatsModel, engine
+from app.services import get_daily_completion_counts, set_habit_completions, toggle_habit_completion
+from app.utils import to_epoch_day
+
+
+@contextmanager
+def insert_after(statement_prefix: str, user_id: str, habit_id: str, day: int):
+    """Inserts the completion right after a matching statement, as a concurrent request would"""
+
+    def insert(conn, _cursor, statement, *_args):
+        if statement.startswith(statement_prefix):
+            conn.exec_driver_sql(
+                "INSERT INTO completions (user_id, habit_id, day) VALUES (?, ?, ?)",
+                (user_id, habit_id, day),
+            )
+
+    event.listen(engine, "after_cursor_execute", insert)
+    try:
+        yield
+    finally:
+        event.remove(engine, "after_cursor_execute", insert)
+
+
+def get_total_completions(db, habit_id: str) -> int:
+    return db.get(HabitStatsModel, habit_id, populate_existing=True).total_completions
+
+
+def test_toggle_completion_round_trip(client, db, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=0)
+    today = date.today().isoformat()
+    form = {"habit_id": habit_id, "date": today, "user_id": user_id}
+
+    assert client.post("/completions", data=form).status_code == 200
+    assert get_total_completions(db, habit_id) == 1
+
+    assert client.post("/completions", data=form).status_code == 200
+    assert get_total_completions(db, habit_id) == 0
+
+
+def test_toggle_does_not_count_row_inserted_concurrently(db, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=0)
+    day = to_epoch_day(date.today())
+
+    with insert_after("DELETE FROM completions", user_id, habit_id, day):
+        _, completed = toggle_habit_completion(db, user_id, habit_id, day)
+
+    assert completed
+    # The concurrent request that inserted the row counts it, this one must not
+    assert get_total_completions(db, habit_id) == 0
+    assert get_daily_completion_counts(db, user_id, day, day) == {}
+
+
+def test_batch_does_not_count_row_inserted_concurrently(db, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=0)
+    day = to_epoch_day(date.today())
+
+    with insert_after("SELECT completions.habit_id", user_id, habit_id, day):
+        result = set_habit_completions(db, user_id, [(habit_id, day, True)])
+
+    assert result["changed"] == 0
+    assert get_total_completions(db, habit_id) == 0
+    assert get_daily_completion_counts(db, user_id, day, day) == {}
+
+
+def test_batch_reports_only_changed_rows(db, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=0)
+    day = to_epoch_day(date.today())
+
+    first = set_habit_completions(db, user_id, [(habit_id, day, True), (habit_id, day - 1, True)])
+    replay = set_habit_completions(db, user_id, [(habit_id, day, True), (habit_id, day - 1, False)])
+
+    assert first["changed"] == 2
+    assert replay["changed"] == 1
+    assert get_total_completions(db, habit_id) == 1
+    assert get_daily_completion_counts(db, user_id, day - 1, day) == {day - 1: 0, day: 1}
+
+
+def test_toggle_counts_day_missing_from_rollup(db, make_habits, user_id):
+    """The rollup table may be created empty over existing completions"""
+    first, second, _, _ = make_habits(user_id, 4, days=1)
+    day = to_epoch_day(date.today())
+    db.execute(delete(DailyRollupModel).where(DailyRollupModel.user_id == user_id))
+    db.commit()
+
+    # Habits 2 and 4 were completed today, un-toggling one leaves 1 and not -1
+    toggle_habit_completion(db, user_id, second, day)
+    assert get_daily_completion_counts(db, user_id, day, day) == {day: 1}
+
+    db.execute(delete(DailyRollupModel).where(DailyRollupModel.user_id == user_id))
+    db.commit()
+    toggle_habit_completion(db, user_id, first, day)
+    assert get_daily_completion_counts(db, user_id, day, day) == {day: 2}
+
+
+def test_rollup_count_never_goes_below_zero(db, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=2)
+    day = to_epoch_day(date.today()) - 1
+    db.execute(
+        update(DailyRollupModel)
+        .where(DailyRollupModel.user_id == user_id)
+        .values(completed_count=0)
+    )
+    db.commit()
+
+    toggle_habit_completion(db, user_id, habit_id, day)
+
+    assert get_daily_completion_counts(db, user_id, day, day) == {day: 0}
+
+
+def test_toggle_fragments_use_parsed_date(client, make_habits, user_id):
+    (habit_id,) = make_habits(user_id, 1, days=0)
+    form = {"habit_id": habit_id, "date": "20240105", "user_id": user_id}
+
+    response = client.post("/completions", data=form)
+
+    assert response.status_code == 200
+    assert f'id="completion-{habit_id}-2024-01-05"' in response.text
+    assert 'id="calendar-day-2024-01-05"' in response.text
+    assert 'id="heatmap-day-2024-01-05"' in response.text
+    assert "20240105" not in response.text
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from app.events import RESYNC_EVENT, EventBroker, format_event, stream_events
+
+
+def drain(subscription) -> list[tuple[str, str]]:
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+def test_slow_consumer_queue_stays_bounded_and_gets_resync():
+    broker = EventBroker(queue_size=4)
+    slow = broker.subscribe("user")
+
+    for n in range(10):
+        broker.publish("user", "delta", f"<div>{n}</div>")
+
+    assert slow.queue.qsize() <= 4
+    assert slow.dropped > 0
+    events = drain(slow)
+    # What was dropped is replaced by one resync, newer events follow it
+    assert RESYNC_EVENT in [event for event, _ in events]
+    assert events[-1] == ("delta", "<div>9</div>")
+
+
+def test_slow_consumer_does_not_block_publisher_or_other_streams():
+    broker = EventBroker(queue_size=4)
+    broker.subscribe("user")
+    fast = broker.subscribe("user")
+
+    started = time.perf_counter()
+    received = []
+    for n in range(10_000):
+        broker.publish("user", "delta", str(n))
+        received.extend(drain(fast))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0
+    assert received == [("delta", str(n)) for n in range(10_000)]
+
+
+def test_originating_page_is_excluded():
+    broker = EventBroker(queue_size=4)
+    origin = broker.subscribe("user", client_id="a")
+    other = broker.subscribe("user", client_id="b")
+
+    broker.publish("user", "delta", "<div></div>", exclude="a")
+
+    assert drain(origin) == []
+    assert drain(other) == [("delta", "<div></div>")]
+
+
+def test_unsubscribe_removes_stream():
+    broker = EventBroker(queue_size=4)
+    subscription = broker.subscribe("user")
+
+    broker.unsubscribe("user", subscription)
+
+    assert broker.connections() == 0
+
+
+def test_stream_sends_resync_after_falling_behind(monkeypatch):
+    broker = EventBroker(queue_size=2)
+    monkeypatch.setattr("app.events.event_broker", broker)
+
+    async def read_stream() -> list[str]:
+        stream = stream_events("user", heartbeat=0.01)
+        received = [await anext(stream)]
+        # Overflows on "2": 0 and 1 are dropped for a resync, then 3 fits after it
+        for n in range(4):
+            broker.publish("user", "delta", str(n))
+        received += [await anext(stream) for _ in range(2)]
+        received.append(await anext(stream))
+        await stream.aclose()
+        return received
+
+    retry, *events, heartbeat = asyncio.run(read_stream())
+
+    assert retry.startswith("retry:")
+    assert events == [format_event(RESYNC_EVENT, ""), format_event("delta", "3")]
+    assert heartbeat == ": heartbeat\n\n"
+    assert broker.connections() == 0
+
+
+def test_format_event_splits_lines():
+    assert format_event("delta", "a\nb") == "event: delta\ndata: a\ndata: b\n\n"
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+import tracemalloc
+import uuid
+
+import pytest
+
+from app.database import CompletionModel, HabitModel, SessionLocal
+from app.export import export_csv, export_ndjson
+
+LARGE_HISTORY_ROWS = 1_000_000
+LARGE_HISTORY_HABITS = 50
+# Far below the ~50 MB the CSV of LARGE_HISTORY_ROWS rows would take if buffered
+EXPORT_MEMORY_BUDGET = 16 * 2**20
+
+
+@pytest.fixture(scope="module")
+def large_history() -> str:
+    """User with LARGE_HISTORY_ROWS completions, seeded once for the module"""
+    user_id = f"export_{uuid.uuid4().hex[:12]}"
+    days_per_habit = LARGE_HISTORY_ROWS // LARGE_HISTORY_HABITS
+    with SessionLocal() as db:
+        for n in range(1, LARGE_HISTORY_HABITS + 1):
+            habit_id = f"{user_id}_{n}"
+            db.add(HabitModel(id=habit_id, user_id=user_id, name=f"Habit {n}", color="#3b82f6"))
+            db.flush()
+            db.execute(
+                CompletionModel.__table__.insert(),
+                [
+                    {"user_id": user_id, "habit_id": habit_id, "day": day}
+                    for day in range(days_per_habit)
+                ],
+            )
+        db.commit()
+    return user_id
+
+
+@pytest.mark.parametrize("exporter", [export_csv, export_ndjson])
+def test_export_streams_large_history_in_fixed_memory(large_history, exporter):
+    lines = 0
+    tracemalloc.start()
+    try:
+        for chunk in exporter(large_history):
+            lines += chunk.count("\n")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # CSV has a header line, NDJSON a line per habit
+    assert lines > LARGE_HISTORY_ROWS
+    assert peak < EXPORT_MEMORY_BUDGET
+
+
+def test_export_csv_rows(client, make_habits, user_id):
+    make_habits(user_id, 2, days=4)
+
+    response = client.get(f"/export?user_id={user_id}&format=csv")
+
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert {row["habit_name"] for row in rows} == {"Habit 1", "Habit 2"}
+    assert len(rows) == 4
+
+
+def test_export_ndjson_lines(client, make_habits, user_id):
+    make_habits(user_id, 2, days=4)
+
+    response = client.get(f"/export?user_id={user_id}&format=ndjson")
+
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["type"] for record in records].count("habit") == 2
+    assert [record["type"] for record in records].count("completion") == 4
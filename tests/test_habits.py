@@ -0,0 +1,49 @@
+from datetime import date
+
+import pytest
+
+from app.database import CASCADE_DELETES, CompletionModel, HabitModel, HabitStatsModel
+from app.services import get_daily_completion_counts, purge_archived_habits
+from app.utils import to_epoch_day
+
+
+def count_rows(db, model, habit_id: str) -> int:
+    column = model.id if model is HabitModel else model.habit_id
+    return db.query(model).filter(column == habit_id).count()
+
+
+@pytest.mark.skipif(CASCADE_DELETES, reason="HABIT_DELETE_MODE=cascade")
+def test_delete_archives_habit_until_purge(client, db, make_habits, user_id):
+    first, second = make_habits(user_id, 2, days=2)
+    today = to_epoch_day(date.today())
+
+    response = client.delete(f"/habits/{first}?user_id={user_id}")
+
+    assert response.status_code == 200
+    assert f"habit-{first}" not in response.text
+    assert count_rows(db, CompletionModel, first) == 1
+    assert get_daily_completion_counts(db, user_id, today - 1, today) == {today - 1: 0, today: 1}
+
+    purge_archived_habits(db, batch_size=100)
+
+    assert count_rows(db, HabitModel, first) == 0
+    assert count_rows(db, CompletionModel, first) == 0
+    assert count_rows(db, CompletionModel, second) == 1
+
+
+@pytest.mark.skipif(not CASCADE_DELETES, reason="HABIT_DELETE_MODE=archive")
+def test_delete_cascades_to_completions_and_stats(client, db, make_habits, user_id):
+    first, second = make_habits(user_id, 2, days=2)
+    today = to_epoch_day(date.today())
+
+    response = client.delete(f"/habits/{first}?user_id={user_id}")
+
+    assert response.status_code == 200
+    assert f"habit-{first}" not in response.text
+    # The database removed the children with the habit, nothing is left to purge
+    assert count_rows(db, HabitModel, first) == 0
+    assert count_rows(db, CompletionModel, first) == 0
+    assert count_rows(db, HabitStatsModel, first) == 0
+    assert count_rows(db, CompletionModel, second) == 1
+    assert get_daily_completion_counts(db, user_id, today - 1, today) == {today - 1: 0, today: 1}
+    assert purge_archived_habits(db, batch_size=100) == {"habits": 0, "completions": 0}
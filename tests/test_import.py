@@ -0,0 +1,121 @@
+from datetime import date
+
+import pytest
+
+from app.database import CompletionModel, HabitModel
+from app.importer import (
+    ImportRecord,
+    InvalidImportFileError,
+    InvalidImportRecordError,
+    parse_csv_records,
+    parse_ndjson_records,
+)
+from app.services import get_daily_completion_counts
+from app.utils import to_epoch_day
+
+
+def test_csv_records():
+    lines = ["habit_id,habit_name,date", "a,Run,2024-01-01", ",Read,"]
+
+    assert list(parse_csv_records(lines)) == [
+        ImportRecord("a", "Run", "2024-01-01"),
+        ImportRecord("Read", "Read", None),
+    ]
+
+
+def test_csv_without_habit_name_column_is_rejected():
+    with pytest.raises(InvalidImportFileError, match="habit_name"):
+        list(parse_csv_records(["name,date", "Run,2024-01-01"]))
+
+
+def test_ndjson_records():
+    lines = [
+        '{"type": "habit", "id": "a", "name": "Run"}',
+        "",
+        '{"type": "completion", "habit_id": "a", "date": "2024-01-01"}',
+    ]
+
+    assert list(parse_ndjson_records(lines)) == [
+        ImportRecord("a", "Run", None),
+        ImportRecord("a", "Run", "2024-01-01"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "[1, 2]",
+        '"x"',
+        "{not json",
+        '{"type": "habit", "id": "a"}',
+        '{"type": "completion", "habit_name": "Run", "date": 20240101}',
+        '{"type": "completion", "habit_id": ["a"], "date": "2024-01-01"}',
+    ],
+)
+def test_invalid_ndjson_line_is_rejected(line):
+    with pytest.raises(InvalidImportRecordError, match="line 2"):
+        list(parse_ndjson_records(['{"type": "habit", "id": "a", "name": "Run"}', line]))
+
+
+@pytest.mark.parametrize(
+    ("import_format", "body", "status_code"),
+    [
+        ("csv", "name,date\nRun,2024-01-01\n", 400),
+        ("ndjson", "[1, 2]\n", 422),
+        ("ndjson", '{"habit_name": "Run", "date": 1}\n', 422),
+        ("csv", "habit_name,date\nRun,2024-01-01\n", 200),
+    ],
+)
+def test_import_endpoint_status(client, user_id, import_format, body, status_code):
+    response = client.post(
+        f"/import?user_id={user_id}&format={import_format}", content=body.encode()
+    )
+
+    assert response.status_code == status_code
+
+
+CSV_HISTORY = """habit_id,habit_name,date
+a,Run,2024-01-01
+a,Run,2024-01-02
+a,Run,2024-01-01
+b,Read,2024-01-01
+"""
+
+NDJSON_HISTORY = """{"type": "habit", "id": "a", "name": "Run"}
+{"type": "habit", "id": "b", "name": "Read"}
+{"type": "completion", "habit_id": "a", "date": "2024-01-01"}
+{"type": "completion", "habit_id": "a", "date": "2024-01-02"}
+{"type": "completion", "habit_id": "a", "date": "2024-01-01"}
+{"type": "completion", "habit_id": "b", "date": "2024-01-01"}
+"""
+
+
+@pytest.mark.parametrize(
+    ("import_format", "body"), [("csv", CSV_HISTORY), ("ndjson", NDJSON_HISTORY)]
+)
+def test_import_creates_habits_and_drops_duplicates(client, db, user_id, import_format, body):
+    url = f"/import?user_id={user_id}&format={import_format}"
+
+    summary = client.post(url, content=body.encode()).json()
+
+    assert summary["habits_created"] == 2
+    assert summary["completions_inserted"] == 3
+    habits = db.query(HabitModel).filter(HabitModel.user_id == user_id).order_by(HabitModel.id)
+    assert [(habit.id, habit.name) for habit in habits] == [
+        (f"{user_id}_1", "Run"),
+        (f"{user_id}_2", "Read"),
+    ]
+    days = {
+        (habit_id, day)
+        for habit_id, day in db.query(CompletionModel.habit_id, CompletionModel.day).filter(
+            CompletionModel.user_id == user_id
+        )
+    }
+    day = to_epoch_day(date(2024, 1, 1))
+    assert days == {(f"{user_id}_1", day), (f"{user_id}_1", day + 1), (f"{user_id}_2", day)}
+    assert get_daily_completion_counts(db, user_id, day, day + 1) == {day: 2, day + 1: 1}
+
+    # Importing the same file again matches habits by name and inserts nothing
+    replay = client.post(url, content=body.encode()).json()
+    assert replay["habits_created"] == 0
+    assert replay["completions_inserted"] == 0
@@ -0,0 +1,27 @@
+from app import main
+from app.metrics import DURATION_BUCKETS, MetricsRegistry, RequestMetrics
+
+
+def test_histogram_counts_slow_requests_only_in_inf_bucket():
+    registry = MetricsRegistry()
+    registry.observe("GET", "/reports", 200, DURATION_BUCKETS[0] / 2, RequestMetrics())
+    registry.observe("GET", "/reports", 200, DURATION_BUCKETS[-1] * 2, RequestMetrics())
+
+    text = registry.render()
+
+    assert f'le="{DURATION_BUCKETS[-1]}"}} 1' in text
+    assert 'le="+Inf"} 2' in text
+
+
+def test_metrics_disabled_by_default(client):
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_ENABLED", True)
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.mark.parametrize("period", ["7days", "30days", "365days"])
+def test_report_query_count_does_not_grow_with_habits(
+    client, make_habits, count_queries, user_id, period
+):
+    one_habit_user, many_habits_user = f"{user_id}_a", f"{user_id}_b"
+    make_habits(one_habit_user, 1)
+    make_habits(many_habits_user, 20)
+
+    counts = []
+    for user in (one_habit_user, many_habits_user):
+        # First request warms templates and connections
+        client.get(f"/reports?user_id={user}&period={period}")
+        with count_queries as counter:
+            response = client.get(f"/reports?user_id={user}&period={period}")
+        assert response.status_code == 200
+        counts.append(counter.count)
+
+    assert counts[0] > 0
+    assert counts[0] == counts[1]
+
+
+def test_report_lists_every_habit(client, make_habits, user_id):
+    make_habits(user_id, 3)
+
+    response = client.get(f"/reports?user_id={user_id}&period=30days")
+
+    assert response.status_code == 200
+    for n in range(1, 4):
+        assert f"Habit {n}" in response.text